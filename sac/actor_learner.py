@@ -0,0 +1,156 @@
+import functools
+import threading
+
+import gym
+import numpy as np
+from gym import spaces
+
+from sac.metrics import NullMetrics
+from sac.networks.numpy_policy import NumpyPolicy
+from sac.vec_env import SerialVecEnv, SubprocVecEnv
+
+# nothing here may import TensorFlow: actor processes only run NumpyPolicy
+
+
+class PolicySync(object):
+    """
+    Decides when the actors' copy of the policy is refreshed from the
+    learner's `pi/` parameters by calling `refresh`: every `sync_interval`
+    actor steps, or sooner once the learner is more than `max_staleness`
+    updates ahead of the copy.
+    """
+
+    def __init__(self, refresh, sync_interval, max_staleness):
+        self.refresh = refresh
+        self.sync_interval = sync_interval
+        self.max_staleness = max_staleness
+        self.lock = threading.Lock()
+        self.updates = 0
+        self.synced_at = 0
+        self.steps_since_sync = 0
+        self.syncs = 0
+
+    def learner_updated(self, num_updates=1):
+        with self.lock:
+            self.updates += num_updates
+
+    def actor_stepped(self):
+        with self.lock:
+            self.steps_since_sync += 1
+            if self.steps_since_sync >= self.sync_interval or \
+                    self.updates - self.synced_at > self.max_staleness:
+                self.refresh()
+                self.synced_at = self.updates
+                self.steps_since_sync = 0
+                self.syncs += 1
+
+    def staleness(self):
+        with self.lock:
+            return self.updates - self.synced_at
+
+
+def build_action_converter(env):
+    def converter(a):
+        if type(env.action_space) is spaces.Discrete:
+                return np.argmax(a)
+        else:
+            a = np.tanh(a)
+            high, low = env.action_space.high, env.action_space.low
+            return ((a + 1) / 2) * (high - low) + low
+    return converter
+
+
+def make_env(env):
+    if env in ('chaser', 'chaser-visual'):
+        from sac.chaser import ChaserEnv
+        return ChaserEnv(visual=(env == 'chaser-visual'))
+    else:
+        return gym.make(env)
+
+
+def make_vec_env(env, num_envs):
+    if env in ('chaser', 'chaser-visual') and num_envs > 1:
+        from sac.chaser import VectorChaserEnv
+        return VectorChaserEnv(num_envs, visual=(env == 'chaser-visual'))
+    env_fns = [functools.partial(make_env, env) for _ in range(num_envs)]
+    if num_envs == 1:
+        return SerialVecEnv(env_fns)
+    else:
+        return SubprocVecEnv(env_fns)
+
+
+def step_envs(env, s1, sample_actions, action_converter, buffer, reward_scale,
+              episode_rewards, metrics=NullMetrics()):
+    """
+    Takes one step in every env of `env`, stores the transitions and resets
+    finished envs. Returns the next observations and the rewards of the
+    episodes that finished.
+    """
+    with metrics.time('sample_actions'):
+        a = sample_actions(s1)
+    with metrics.time('env_step'):
+        s2, r, t, info = env.step([action_converter(a_i) for a_i in a])
+
+    episode_rewards += r
+    # env.render()
+    r = r / reward_scale
+    with metrics.time('buffer_append'):
+        for i in range(env.num_envs):
+            buffer.append(s1[i], a[i], r[i], s2[i], t[i])
+    metrics.count('transitions', env.num_envs)
+    finished = []
+    if np.any(t):
+        done = np.flatnonzero(t)
+        with metrics.time('env_reset'):
+            s2 = env.reset(done)
+        finished = list(episode_rewards[done])
+        episode_rewards[done] = 0
+    return s2, finished
+
+
+def act(env, sample_actions, action_converter, buffer, reward_scale,
+        end_episodes, stop_event, before_step=None, metrics=NullMetrics()):
+    s1 = env.reset()
+    episode_rewards = np.zeros(env.num_envs)
+    while not stop_event.is_set():
+        if before_step is not None:
+            before_step()
+        s1, finished = step_envs(env, s1, sample_actions, action_converter,
+                                 buffer, reward_scale, episode_rewards, metrics)
+        end_episodes(env.num_envs, finished)
+
+
+def process_actor(env_name, num_envs, replay, params, reward_scale, stop_event,
+                  episodes, seed, sync_interval, max_staleness, report_interval=100):
+    """
+    Actor process: steps its own envs with a NumpyPolicy that follows the
+    learner's published parameters, appends straight into the shared
+    replay buffer and reports steps and finished episodes on `episodes`.
+    As with actor threads, a PolicySync decides when the policy is
+    refreshed; here that asks the learner to publish, and the new
+    parameters are picked up once they arrive.
+    """
+    np.random.seed(seed)
+    env = make_vec_env(env_name, num_envs)
+    action_converter = build_action_converter(env)
+    values, version = params.read()
+    policy = NumpyPolicy(values)
+    sync = PolicySync(params.request, sync_interval, max_staleness)
+    s1 = env.reset()
+    episode_rewards = np.zeros(env.num_envs)
+    num_steps, finished = 0, []
+    try:
+        while not stop_event.is_set():
+            sync.learner_updated(params.learner_updates() - sync.updates)
+            sync.actor_stepped()
+            if params.version() != version:
+                policy.params, version = params.read()
+            s1, new_finished = step_envs(env, s1, policy.sample_actions, action_converter,
+                                         replay, reward_scale, episode_rewards)
+            num_steps += env.num_envs
+            finished += new_finished
+            if finished or num_steps >= report_interval:
+                episodes.put((num_steps, finished))
+                num_steps, finished = 0, []
+    except KeyboardInterrupt:
+        pass
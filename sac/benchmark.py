@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import types
+
+import numpy as np
+from gym import spaces
+
+from sac.chaser import ChaserEnv
+from sac.replay_buffer.replay_buffer import ReplayBuffer, ReplayBuffer2, \
+        ArrayReplayBuffer
+
+
+def measure(fn, calls, warmup, repeats):
+    """
+    Calls `fn` `warmup` times, then `repeats` times `calls` times, and
+    returns statistics of the calls per second over the repeats.
+    """
+    for _ in range(warmup):
+        fn()
+    rates = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        rates.append(calls / (time.perf_counter() - start))
+    return {'mean': float(np.mean(rates)), 'std': float(np.std(rates)),
+            'min': float(np.min(rates)), 'max': float(np.max(rates)),
+            'calls': calls, 'repeats': repeats}
+
+
+def bench_env(calls, warmup, repeats):
+    results = []
+    for visual in (False, True):
+        env = ChaserEnv(visual=visual)
+        env.reset()
+
+        def step():
+            _, _, t, _ = env.step(np.random.randint(4))
+            if t:
+                env.reset()
+
+        for name, fn in [('step', step), ('reset', env.reset),
+                         ('get_random_batch', lambda: env.get_random_batch(32))]:
+            results.append(dict(name='chaser.%s' % name, params={'visual': visual},
+                                unit='calls/s', **measure(fn, calls, warmup, repeats)))
+    return results
+
+
+def fill_buffer(buffer, size, s_shape, a_shape):
+    s = np.random.uniform(size=s_shape).astype(np.float32)
+    a = np.random.uniform(size=a_shape).astype(np.float32)
+    for _ in range(size):
+        buffer.append(s, a, 0., s, False)
+
+
+def bench_buffers(calls, warmup, repeats, sizes, batch_sizes):
+    s_shape, a_shape = [17], [6]
+    buffer_types = [('ReplayBuffer', lambda n: ReplayBuffer(n)),
+                    ('ReplayBuffer2', lambda n: ReplayBuffer2(n)),
+                    ('ArrayReplayBuffer', lambda n: ArrayReplayBuffer(n, s_shape, a_shape))]
+    s = np.random.uniform(size=s_shape).astype(np.float32)
+    a = np.random.uniform(size=a_shape).astype(np.float32)
+    results = []
+    for name, make_buffer in buffer_types:
+        for size in sizes:
+            buffer = make_buffer(size)
+            fill_buffer(buffer, size, s_shape, a_shape)
+            results.append(dict(name='%s.append' % name, params={'size': size},
+                                unit='transitions/s', **measure(
+                                    lambda: buffer.append(s, a, 0., s, False),
+                                    calls, warmup, repeats)))
+            for batch_size in batch_sizes:
+                results.append(dict(name='%s.sample' % name,
+                                    params={'size': size, 'batch_size': batch_size},
+                                    unit='batches/s', **measure(
+                                        lambda: buffer.sample(batch_size),
+                                        calls, warmup, repeats)))
+    return results
+
+
+AGENT_ENVS = {
+    'gaussian': types.SimpleNamespace(
+        observation_space=spaces.Box(-1, 1, shape=[17]),
+        action_space=spaces.Box(-1, 1, shape=[6])),
+    'categorical': types.SimpleNamespace(
+        observation_space=spaces.Box(0, 1, shape=[4]),
+        action_space=spaces.Discrete(4)),
+}
+
+# build_agent options of the graph variants, and the relative error each
+# may have against the float32 graph
+AGENT_VARIANTS = {
+    'float32': ({}, 0.),
+    'xla': ({'xla': True}, 1e-4),
+    'float16': ({'compute_dtype': 'float16'}, 2e-2),
+    'bfloat16': ({'compute_dtype': 'bfloat16'}, 5e-2),
+}
+
+
+def random_batch(policy, env, a_shape, batch_size):
+    s_shape = list(env.observation_space.shape)
+    S1 = np.random.uniform(size=[batch_size] + s_shape)
+    S2 = np.random.uniform(size=[batch_size] + s_shape)
+    A = np.eye(a_shape[0])[np.random.randint(a_shape[0], size=batch_size)] \
+        if policy == 'categorical' else np.random.normal(size=[batch_size] + a_shape)
+    R = np.random.normal(size=batch_size)
+    T = np.zeros(batch_size)
+    return S1, A, R, S2, T
+
+
+def bench_agents(calls, warmup, repeats, batch_size, variants=('float32',)):
+    # deferred so that env and buffer benchmarks run without TensorFlow
+    import tensorflow as tf
+    from sac.main import build_agent
+
+    results = []
+    for policy, env in sorted(AGENT_ENVS.items()):
+        for variant in variants:
+            with tf.Graph().as_default():
+                tf.set_random_seed(0)
+                agent = build_agent(env, **AGENT_VARIANTS[variant][0])
+                s1 = np.random.uniform(size=[1] + list(env.observation_space.shape))
+                S, A, R, _, T = random_batch(policy, env, list(agent.a_shape), batch_size)
+                results.append(dict(name='agent.sample_actions',
+                                    params={'policy': policy, 'variant': variant},
+                                    unit='calls/s', **measure(
+                                        lambda: agent.sample_actions(s1),
+                                        calls, warmup, repeats)))
+                results.append(dict(name='agent.train_step',
+                                    params={'policy': policy, 'variant': variant,
+                                            'batch_size': batch_size},
+                                    unit='updates/s', **measure(
+                                        lambda: agent.train_step(S, A, R, S, T),
+                                        calls, warmup, repeats)))
+                agent.sess.close()
+    return results
+
+
+def agent_outputs(agent, batch):
+    """
+    The deterministic outputs of an agent on a batch: Q(S1, A), the TD errors
+    against V_bar(S2), log pi(A | S1) and the gradients of the Q loss.
+    """
+    S1, A, R, S2, T = batch
+    feed_dict = {agent.S1: S1, agent.A: A, agent.R: R, agent.S2: S2, agent.T: T}
+    log_prob = agent.pi_network_log_prob(agent.A, agent.S1, 'pi', reuse=True)
+    outputs = dict(zip(['Q', 'TD', 'log_pi'], agent.sess.run(
+        [agent.Q_mean, agent.TD, log_prob], feed_dict)))
+    gradients = agent.compute_gradients(S1, A, R, S2, T)[0]
+    # gradients are ordered as xi, theta, phi
+    outputs['Q_gradients'] = np.concatenate([
+        np.ravel(g) for g in gradients[len(agent.xi):len(agent.xi) + len(agent.theta)]])
+    return outputs
+
+
+def check_agents(batch_size, variants):
+    """
+    Compares every graph variant with the float32 graph: both get the same
+    variables and batch, and the maximum error of each output relative to
+    the largest float32 value must stay within the variant's tolerance.
+    """
+    import tensorflow as tf
+    from sac.main import build_agent
+
+    results = []
+    for policy, env in sorted(AGENT_ENVS.items()):
+        with tf.Graph().as_default():
+            reference = build_agent(env)
+            batch = random_batch(policy, env, list(reference.a_shape), batch_size)
+            expected = agent_outputs(reference, batch)
+            variables = reference.get_variables()
+            reference.sess.close()
+        for variant in variants:
+            options, tolerance = AGENT_VARIANTS[variant]
+            with tf.Graph().as_default():
+                agent = build_agent(env, **options)
+                agent.set_variables(variables)
+                actual = agent_outputs(agent, batch)
+                agent.sess.close()
+            errors = {name: float(np.max(np.abs(actual[name] - expected[name])) /
+                                  (np.max(np.abs(expected[name])) + 1e-8))
+                      for name in expected}
+            results.append(dict(name='agent.check', params={'policy': policy, 'variant': variant},
+                                unit='max relative error', mean=max(errors.values()),
+                                errors=errors, tolerance=tolerance,
+                                passed=max(errors.values()) <= tolerance))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--suites', default='env,buffer,agent',
+                        help='comma-separated subset of env,buffer,agent,check')
+    parser.add_argument('--agent-variants', default='float32',
+                        help='comma-separated graph variants of the agent and '
+                             'check suites, out of %s' % ','.join(sorted(AGENT_VARIANTS)))
+    parser.add_argument('--calls', default=1000, type=int)
+    parser.add_argument('--warmup', default=100, type=int)
+    parser.add_argument('--repeats', default=5, type=int)
+    parser.add_argument('--buffer-sizes', default='1000,100000,1000000')
+    parser.add_argument('--batch-sizes', default='32,256')
+    parser.add_argument('--seed', default=0, type=int)
+    args = parser.parse_args()
+
+    np.random.seed(args.seed)
+    suites = args.suites.split(',')
+    batch_sizes = [int(x) for x in args.batch_sizes.split(',')]
+    results = []
+    if 'env' in suites:
+        results += bench_env(args.calls, args.warmup, args.repeats)
+    if 'buffer' in suites:
+        results += bench_buffers(args.calls, args.warmup, args.repeats,
+                                 [int(x) for x in args.buffer_sizes.split(',')],
+                                 batch_sizes)
+    variants = args.agent_variants.split(',')
+    if 'agent' in suites:
+        results += bench_agents(args.calls, args.warmup, args.repeats, batch_sizes[0],
+                                variants)
+    if 'check' in suites:
+        results += check_agents(batch_sizes[0], [v for v in variants if v != 'float32'])
+    for result in results:
+        if 'passed' in result:
+            print('%-30s %-45s %12.2e %s' % (result['name'], result['params'], result['mean'],
+                                             'ok' if result['passed'] else 'FAILED'))
+        else:
+            print('%-30s %-45s %12.1f %s' % (result['name'], result['params'],
+                                             result['mean'], result['unit']))
+    report = {
+        'commit': git_commit(),
+        'time': time.time(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'args': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
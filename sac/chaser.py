@@ -1,7 +1,7 @@
 import pygame
 import numpy as np
 import cv2
-import utils
+from sac import utils
 
 from gym import Env, spaces
 
@@ -34,7 +34,8 @@ class ChaserEnv(Env):
         self.surface = pygame.Surface((self.size * self.block_pixels, self.size * self.block_pixels))
 
         if self.visual:
-            self.observation_space = spaces.Box(0, 1, shape=[self.size * self.block_pixels, self.size * self.block_pixels, 3])
+            self.observation_space = spaces.Box(0, 255, shape=[self.size * self.block_pixels, self.size * self.block_pixels, 3],
+                                                dtype=np.uint8)
         else:
             # position of agent and position of prey.
             self.observation_space = spaces.Box(0, 1, shape=[4])
@@ -129,6 +130,119 @@ class ChaserEnv(Env):
         cv2.waitKey(1)
 
 
+# layout of (non-visual) observations: agent position, then prey position (the goal)
+ACHIEVED_GOAL = slice(0, 2)
+GOAL = slice(2, 4)
+
+
+def goal_reward(achieved_goals, goals, size=20):
+    """
+    Vectorized ChaserEnv reward for batches of normalized agent positions
+    `achieved_goals` and prey positions `goals`. Returns the rewards and
+    whether each goal was reached (the terminal condition).
+    """
+    rewards = -np.sqrt(np.sum(np.square(achieved_goals - goals), axis=-1))
+    reached = np.all(np.round(achieved_goals * size) == np.round(goals * size), axis=-1)
+    return rewards, reached
+
+
+class VectorChaserEnv(object):
+    """
+    Steps `num_envs` independent ChaserEnvs at once. Positions are held as
+    [num_envs, 2] integer arrays, and observations, rewards and terminals are
+    computed for the whole batch with array operations. Visual observations
+    are painted into a batch of blocks and upsampled, matching the
+    `pygame.surfarray.array3d` layout of ChaserEnv (indexed [x, y, channel]).
+
+    Environments are not reset automatically: `step` returns the
+    post-step observation of every env (so terminal transitions keep their
+    real s2), and `reset(indices)` restarts the given envs.
+    """
+
+    def __init__(self, num_envs, visual=False, no_prey=False, max_steps=1000):
+        self.num_envs = num_envs
+        self.size = 20
+        self.block_pixels = 2
+        self.visual = visual
+        self.no_prey = no_prey
+        self.max_steps = max_steps
+        self.action_space = spaces.Discrete(4)
+        self.agent_color = np.array((255, 0, 0), dtype=np.uint8)
+        self.prey_color = np.array((0, 255, 0), dtype=np.uint8)
+        self.overlap_color = np.array((0, 0, 255), dtype=np.uint8)
+        self.background_color = np.array((255, 255, 255), dtype=np.uint8)
+        self.action_deltas = np.array([(1, 0), (-1, 0), (0, 1), (0, -1)])
+        if self.visual:
+            self.observation_space = spaces.Box(0, 255, shape=[self.size * self.block_pixels, self.size * self.block_pixels, 3],
+                                                dtype=np.uint8)
+        else:
+            self.observation_space = spaces.Box(0, 1, shape=[4])
+        self.agent_pos = np.zeros([num_envs, 2], dtype=np.int64)
+        self.prey_pos = np.zeros([num_envs, 2], dtype=np.int64)
+        self.step_num = np.zeros([num_envs], dtype=np.int64)
+        self.reset()
+
+    def get_positions(self, n, positions_to_avoid=None):
+        positions = np.random.randint(0, self.size, size=[n, 2])
+        if positions_to_avoid is not None:
+            clash = np.all(positions == positions_to_avoid, axis=1)
+            while np.any(clash):
+                positions[clash] = np.random.randint(0, self.size, size=[clash.sum(), 2])
+                clash = np.all(positions == positions_to_avoid, axis=1)
+        return positions
+
+    def get_obs(self, agent_pos, prey_pos, visual):
+        if not visual:
+            if self.no_prey:
+                return agent_pos.copy()
+            return np.concatenate([agent_pos, prey_pos], axis=1) / self.size
+        n = len(agent_pos)
+        # one cell per block with a border row/column for positions clipped
+        # to `size`, which ChaserEnv draws off the surface
+        blocks = np.empty([n, self.size + 1, self.size + 1, 3], dtype=np.uint8)
+        blocks[:] = self.background_color
+        envs = np.arange(n)
+        if self.no_prey:
+            blocks[envs, agent_pos[:, 0], agent_pos[:, 1]] = self.agent_color
+        else:
+            overlap = np.all(agent_pos == prey_pos, axis=1)
+            blocks[envs, prey_pos[:, 0], prey_pos[:, 1]] = self.prey_color
+            blocks[envs, agent_pos[:, 0], agent_pos[:, 1]] = np.where(
+                overlap[:, None], self.overlap_color, self.agent_color)
+        blocks = blocks[:, :self.size, :self.size]
+        pixels = self.block_pixels
+        return blocks.repeat(pixels, axis=1).repeat(pixels, axis=2)
+
+    def reset(self, indices=None):
+        if indices is None:
+            indices = np.arange(self.num_envs)
+        indices = np.asarray(indices)
+        if indices.dtype == np.bool_:
+            indices = np.flatnonzero(indices)
+        self.agent_pos[indices] = self.get_positions(len(indices))
+        self.prey_pos[indices] = self.get_positions(len(indices), self.agent_pos[indices])
+        self.step_num[indices] = 0
+        return self.get_obs(self.agent_pos, self.prey_pos, self.visual)
+
+    def step(self, actions):
+        self.step_num += 1
+        delta = self.action_deltas[np.asarray(actions)]
+        self.agent_pos = np.clip(self.agent_pos + delta, 0, self.size)
+
+        dist = np.sqrt(np.sum(np.square((self.agent_pos - self.prey_pos) / self.size), axis=1))
+        reward = -dist
+        caught = np.all(self.agent_pos == self.prey_pos, axis=1) & (not self.no_prey)
+        terminal = caught | (self.step_num >= self.max_steps)
+        return self.get_obs(self.agent_pos, self.prey_pos, self.visual), reward, terminal, {}
+
+    def get_random_batch(self, batch_size):
+        return self.get_obs(self.get_positions(batch_size),
+                            self.get_positions(batch_size), self.visual)
+
+    def close(self):
+        pass
+
+
 env = ChaserEnv()
 
 def get_batch_chaser(batch_size):
@@ -0,0 +1,151 @@
+import time
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+
+class Communicator(object):
+    """
+    Collective operations between `world_size` learner processes over
+    `multiprocessing.connection` sockets, so they need no external services:
+    rank 0 listens on `address` (a (host, port) pair; port 0 picks a free
+    one, see `address` after construction) and the other ranks connect to
+    it. Reductions are computed by rank 0 and sent back, so every rank gets
+    bitwise identical results.
+    """
+
+    def __init__(self, rank, world_size, address, authkey=b'sac'):
+        self.rank = rank
+        self.world_size = world_size
+        self.authkey = authkey
+        self.listener = None
+        self.connections = []
+        if rank == 0:
+            self.listener = Listener(address, authkey=authkey)
+            self.address = self.listener.address
+        else:
+            self.address = address
+
+    def connect(self, timeout=60.):
+        if self.rank == 0:
+            connections = {}
+            for _ in range(self.world_size - 1):
+                connection = self.listener.accept()
+                connections[connection.recv()] = connection
+            self.connections = [connections[rank] for rank in sorted(connections)]
+            self.listener.close()
+            return
+        # rank 0 may not be listening yet
+        deadline = time.time() + timeout
+        while True:
+            try:
+                connection = Client(self.address, authkey=self.authkey)
+                break
+            except ConnectionRefusedError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+        connection.send(self.rank)
+        self.connections = [connection]
+
+    def gather(self, value):
+        """ Returns the values of all ranks, in rank order, on rank 0. """
+        if self.rank != 0:
+            self.connections[0].send(value)
+            return None
+        return [value] + [connection.recv() for connection in self.connections]
+
+    def broadcast(self, value):
+        """ Returns rank 0's value on every rank. """
+        if self.rank != 0:
+            return self.connections[0].recv()
+        for connection in self.connections:
+            connection.send(value)
+        return value
+
+    def allreduce_mean(self, arrays):
+        values = self.gather(arrays)
+        if self.rank == 0:
+            values = [np.mean(elements, axis=0).astype(np.asarray(elements[0]).dtype)
+                      for elements in zip(*values)]
+        return self.broadcast(values)
+
+    def all(self, flag):
+        values = self.gather(bool(flag))
+        return self.broadcast(None if values is None else all(values))
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+
+class DataParallelLearner(object):
+    """
+    Synchronous data-parallel training of one agent per process. Each rank
+    computes gradients on a batch from its own replay shard; the gradients
+    (and losses) are averaged over all ranks and every rank applies the
+    same average with its own optimizers, followed by the soft update of
+    V_bar. Starting from rank 0's variables, all copies, including V_bar
+    and the optimizer slots, therefore stay identical, and the effective
+    batch size is `world_size` times the per-rank batch size. Every
+    `check_interval` updates a checksum of the variables is compared
+    across ranks.
+
+    `train_step` and `train_steps` can be used in place of the agent's.
+    Every rank must make the same sequence of calls.
+    """
+
+    def __init__(self, agent, communicator, check_interval=1000):
+        self.agent = agent
+        self.communicator = communicator
+        self.check_interval = check_interval
+        self.updates = 0
+        self.all_ready = False
+        agent.build_gradient_train()
+        values = communicator.broadcast(agent.get_variables() if communicator.rank == 0 else None)
+        if communicator.rank != 0:
+            agent.set_variables(values)
+
+    def ready(self, local_ready):
+        """
+        Whether every rank is ready to train. Once they all were, buffers
+        only grow, so no more messages are exchanged.
+        """
+        if not self.all_ready:
+            self.all_ready = self.communicator.all(local_ready)
+        return self.all_ready
+
+    def train_step(self, S1, A, R, S2, T, W=None, D=None, return_td_errors=False,
+                   trace_path=None):
+        gradients, V_loss, Q_loss, pi_loss, TD = self.agent.compute_gradients(
+            S1, A, R, S2, T, W, D, trace_path)
+        averaged = self.communicator.allreduce_mean(
+            gradients + [np.array([V_loss, Q_loss, pi_loss])])
+        self.agent.apply_gradients(averaged[:-1])
+        V_loss, Q_loss, pi_loss = averaged[-1]
+        self.updates += 1
+        if self.updates % self.check_interval == 0:
+            self.check_consistency()
+        if return_td_errors:
+            return V_loss, Q_loss, pi_loss, TD
+        return V_loss, Q_loss, pi_loss
+
+    def train_steps(self, S1, A, R, S2, T, W=None, D=None, return_td_errors=False,
+                    trace_path=None):
+        outputs = []
+        for i in range(len(R)):
+            outputs.append(self.train_step(
+                S1[i], A[i], R[i], S2[i], T[i], None if W is None else W[i],
+                None if D is None else D[i], return_td_errors,
+                trace_path if i == 0 else None))
+        return tuple(np.stack(output) for output in zip(*outputs))
+
+    def check_consistency(self):
+        checksum = [float(np.sum(value, dtype=np.float64))
+                    for value in self.agent.get_variables()]
+        checksums = self.communicator.gather(checksum)
+        consistent = self.communicator.broadcast(
+            None if checksums is None else all(c == checksums[0] for c in checksums))
+        if not consistent:
+            raise RuntimeError('Learner variables diverged across ranks after %s '
+                               'updates' % self.updates)
@@ -0,0 +1,123 @@
+import time
+from multiprocessing import Process, Queue
+from queue import Empty, Full
+
+import numpy as np
+
+from sac.metrics import NullMetrics
+from sac.networks.numpy_policy import NumpyPolicy
+
+
+def evaluate(env, policy, action_converter, num_episodes):
+    """
+    Runs `num_episodes` episodes of `env` with the deterministic actions of
+    `policy` and returns their returns and lengths.
+    """
+    returns, lengths = [], []
+    for _ in range(num_episodes):
+        s = env.reset()
+        episode_return, episode_length, t = 0., 0, False
+        while not t:
+            a = policy.deterministic_actions(np.expand_dims(s, 0))[0]
+            s, r, t, _ = env.step(action_converter(a))
+            episode_return += r
+            episode_length += 1
+        returns.append(float(episode_return))
+        lengths.append(episode_length)
+    return returns, lengths
+
+
+def eval_worker(snapshots, results, env_fn, make_action_converter, num_episodes):
+    env = env_fn()
+    action_converter = make_action_converter(env)
+    try:
+        while True:
+            snapshot = snapshots.get()
+            if snapshot is None:
+                break
+            updates, params = snapshot
+            start = time.time()
+            returns, lengths = evaluate(env, NumpyPolicy(params), action_converter,
+                                        num_episodes)
+            results.put({'updates': updates, 'returns': returns, 'lengths': lengths,
+                         'mean_return': float(np.mean(returns)),
+                         'std_return': float(np.std(returns)),
+                         'seconds': time.time() - start})
+    except KeyboardInterrupt:
+        pass
+    finally:
+        env.close()
+
+
+class EvaluationWorker(object):
+    """
+    Evaluates snapshots of the learner's `pi/` parameters in a separate
+    process with its own env (built by `env_fn`), running `num_episodes`
+    episodes with deterministic actions: the mean for GaussianPolicy, the
+    argmax for CategoricalPolicy. The learner calls `learner_updated` after
+    its updates; every `interval` updates the policy is snapshotted and
+    handed to the worker without waiting. If the worker has not yet
+    returned the result of an earlier snapshot, the new one is skipped
+    rather than queued, so results lag by at most one evaluation.
+
+    Finished evaluations are collected by `poll` (called from
+    `learner_updated`), printed and written to `metrics` as 'evaluation'
+    events. Create the worker before the agent's session so the forked
+    process does not inherit TensorFlow's threads.
+    """
+
+    def __init__(self, env_fn, make_action_converter, num_episodes=10,
+                 interval=10000, metrics=NullMetrics()):
+        self.interval = interval
+        self.metrics = metrics
+        self.snapshots = Queue(maxsize=1)
+        self.results = Queue()
+        self.process = Process(target=eval_worker, daemon=True, args=(
+            self.snapshots, self.results, env_fn, make_action_converter, num_episodes))
+        self.process.start()
+        self.updates = 0
+        self.next_evaluation = interval
+        self.skipped = 0
+        # snapshots handed over whose results have not been polled yet
+        self.pending = 0
+
+    def learner_updated(self, agent, num_updates=1):
+        self.updates += num_updates
+        self.poll()
+        if self.updates < self.next_evaluation:
+            return
+        self.next_evaluation = self.updates + self.interval
+        if self.pending > 0:
+            self.skipped += 1
+            return
+        try:
+            self.snapshots.put_nowait((self.updates, NumpyPolicy.snapshot(agent)))
+            self.pending += 1
+        except Full:
+            self.skipped += 1
+
+    def poll(self):
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except Empty:
+                return
+            self.pending -= 1
+            print('Evaluation at %s updates\t Mean Reward: %s' % (
+                result['updates'], result['mean_return']))
+            self.metrics.event('evaluation', skipped=self.skipped, **result)
+
+    def close(self, timeout=10.):
+        # drop a pending snapshot so the stop signal fits in the queue
+        try:
+            self.snapshots.get_nowait()
+        except Empty:
+            pass
+        try:
+            self.snapshots.put_nowait(None)
+        except Full:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.poll()
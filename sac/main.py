@@ -1,89 +1,620 @@
+import functools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import types
+
 import numpy as np
-import gym
+import tensorflow as tf
 from gym import spaces
 
-from sac.replay_buffer.replay_buffer import ReplayBuffer2
+from sac.replay_buffer.replay_buffer import ArrayReplayBuffer, \
+        MemmapReplayBuffer, FrameReplayBuffer, LockedBuffer, StatisticsBuffer
+from sac.replay_buffer.prefetch import PrefetchingBuffer
+from sac.replay_buffer.prioritized import PrioritizedReplayBuffer
+from sac.replay_buffer.hindsight import HindsightReplayBuffer
+from sac.replay_buffer.n_step import NStepReplayBuffer
+from sac.replay_buffer.dataset import export_buffer, StreamingDataset
 from sac.networks.policy_mixins import MLPPolicy, GaussianPolicy, \
         CategoricalPolicy
-from sac.networks.value_function_mixins import MLPValueFunc
+from sac.networks.value_function_mixins import MLPValueFunc, \
+        EnsembleMLPValueFunc
+from sac.networks.curiosity_mixins import ForwardModelCuriosity, \
+        InverseModelCuriosity
 from sac.networks.network_interface import AbstractSoftActorCritic
+from sac.networks.numpy_policy import NumpyPolicy
+from sac.actor_learner import PolicySync, build_action_converter, make_env, \
+        make_vec_env, step_envs, act, process_actor
+from sac.metrics import Metrics, NullMetrics
+from sac.evaluation import EvaluationWorker
+from sac.data_parallel import Communicator, DataParallelLearner
 import argparse
 
 
-def build_agent(env):
+def get_action_shape(env):
+    if type(env.action_space) is spaces.Discrete:
+        return [env.action_space.n]
+    else:
+        return env.action_space.shape
+
+
+def build_agent(env, num_Q_heads=1, num_V_heads=1, Q_reduction='min',
+                curiosity=None, intrinsic_weight=0.1, compute_dtype='float32',
+                **kwargs):
     state_shape = env.observation_space.shape
+    action_shape = get_action_shape(env)
     if type(env.action_space) is spaces.Discrete:
         print('is discrete')
-        action_shape = [env.action_space.n]
         PolicyType = CategoricalPolicy
     else:
         print('is gaussian')
-        action_shape = env.action_space.shape
         PolicyType = GaussianPolicy
+    if num_Q_heads > 1 or num_V_heads > 1:
+        ValueFuncType = EnsembleMLPValueFunc
+        attributes = dict(num_Q_heads=num_Q_heads, num_V_heads=num_V_heads,
+                          Q_reduction=Q_reduction)
+    else:
+        ValueFuncType = MLPValueFunc
+        attributes = {}
+    curiosity_mixins = {
+        None: [],
+        'forward': [ForwardModelCuriosity],
+        'inverse': [InverseModelCuriosity],
+    }[curiosity]
+    if curiosity is not None:
+        attributes['intrinsic_weight'] = intrinsic_weight
+    if compute_dtype != 'float32':
+        attributes['compute_dtype'] = compute_dtype
+    bases = [PolicyType, MLPPolicy, ValueFuncType] + curiosity_mixins + \
+        [AbstractSoftActorCritic]
+
+    class Agent(*bases):
+        def __init__(self, s_shape, a_shape, **kwargs):
+            super(Agent, self).__init__(s_shape, a_shape, **kwargs)
+
+    # hyperparameters of the mixins are class attributes of the agent
+    for name, value in attributes.items():
+        setattr(Agent, name, value)
+    return Agent(state_shape, action_shape, **kwargs)
+
+
+def space_attributes(env, n_step=1, reward_scale=1.):
+    """ The spaces of `env` (and how rewards were stored) as JSON for a dataset. """
+    if type(env.action_space) is spaces.Discrete:
+        action_space = {'type': 'discrete', 'n': int(env.action_space.n)}
+    else:
+        action_space = {'type': 'box', 'low': env.action_space.low.tolist(),
+                        'high': env.action_space.high.tolist()}
+    return {'observation_shape': list(env.observation_space.shape),
+            'action_space': action_space, 'n_step': n_step,
+            'reward_scale': reward_scale}
 
-    class Agent(PolicyType, MLPPolicy, MLPValueFunc, AbstractSoftActorCritic):
-        def __init__(self, s_shape, a_shape):
-            super(Agent, self).__init__(s_shape, a_shape)
 
-    return Agent(state_shape, action_shape)
+def dataset_env(attributes):
+    """ Stand-in with the spaces of the env a dataset was recorded in. """
+    action_space = attributes['action_space']
+    if action_space['type'] == 'discrete':
+        action_space = spaces.Discrete(action_space['n'])
+    else:
+        action_space = spaces.Box(np.array(action_space['low']),
+                                  np.array(action_space['high']))
+    return types.SimpleNamespace(
+        observation_space=spaces.Box(0, 1, shape=attributes['observation_shape']),
+        action_space=action_space)
 
 
-def build_action_converter(env):
-    def converter(a):
-        if type(env.action_space) is spaces.Discrete:
-                return np.argmax(a)
-        else:
-            a = np.tanh(a)
-            high, low = env.action_space.high, env.action_space.low
-            return ((a + 1) / 2) * (high - low) + low
-    return converter
+def build_buffer(env, buffer_size, buffer_dir=None, frame_buffer=False,
+                 prioritized=False, hindsight=False, relabel_prob=0.8,
+                 reward_scale=1., n_step=1, gamma=0.99, shared=False):
+    s_shape = env.observation_space.shape
+    a_shape = get_action_shape(env)
+    if shared:
+        if frame_buffer or buffer_dir is not None or prioritized or hindsight or n_step > 1:
+            raise ValueError('--actor-processes cannot be combined with --frame-buffer, '
+                             '--buffer-dir, --prioritized, --hindsight or --n-step')
+        # multiprocessing.shared_memory needs Python 3.8
+        from sac.replay_buffer.shared import SharedReplayBuffer
+        return SharedReplayBuffer(buffer_size, s_shape, a_shape)
+    if n_step > 1:
+        if frame_buffer or buffer_dir is not None or prioritized or hindsight:
+            raise ValueError('--n-step cannot be combined with --frame-buffer, '
+                             '--buffer-dir, --prioritized or --hindsight')
+        return NStepReplayBuffer(buffer_size, s_shape, a_shape, n_step, gamma,
+                                 num_streams=env.num_envs)
+    if hindsight:
+        if frame_buffer or buffer_dir is not None or prioritized:
+            raise ValueError('--hindsight cannot be combined with --frame-buffer, '
+                             '--buffer-dir or --prioritized')
+        from sac.chaser import ACHIEVED_GOAL, GOAL, goal_reward
+        return HindsightReplayBuffer(buffer_size, s_shape, a_shape, ACHIEVED_GOAL,
+                                     GOAL, goal_reward, relabel_prob, reward_scale,
+                                     num_streams=env.num_envs)
+    if prioritized:
+        if frame_buffer or buffer_dir is not None:
+            raise ValueError('--prioritized cannot be combined with '
+                             '--frame-buffer or --buffer-dir')
+        return PrioritizedReplayBuffer(buffer_size, s_shape, a_shape)
+    if frame_buffer:
+        if buffer_dir is not None:
+            raise ValueError('--frame-buffer cannot be combined with --buffer-dir')
+        if len(s_shape) != 3 or env.observation_space.dtype != np.uint8:
+            raise ValueError('--frame-buffer stores observations as uint8 frames, so '
+                             'it needs [height, width, channels] uint8 observations '
+                             '(e.g. --env chaser-visual)')
+        return FrameReplayBuffer(buffer_size, s_shape, a_shape)
+    if buffer_dir is None:
+        return ArrayReplayBuffer(buffer_size, s_shape, a_shape)
+    buffer = MemmapReplayBuffer(buffer_dir, buffer_size, s_shape, a_shape)
+    if buffer.resumed:
+        print('Resuming from %s transitions in %s' % (len(buffer), buffer_dir))
+    return buffer
 
 
-def run_training(env, buffer_size, reward_scale, batch_size, num_train_steps):
-    if env == 'chaser':
-        env = sac.ChaserEnv()
+def train_agent(agent, buffer, batch_size, num_train_steps,
+                fuse_train_steps=False, prioritized=False, n_step=1,
+                metrics=NullMetrics()):
+    def train_on_sample(train, sample, trace_path):
+        with metrics.time('train_step'):
+            if n_step > 1:
+                s1, a, r, s2, t, d = sample
+                return train(s1, a, r, s2, t, D=d, trace_path=trace_path)
+            if not prioritized:
+                return train(*sample, trace_path=trace_path)
+            s1, a, r, s2, t, w, indices = sample
+            v_loss, q_loss, pi_loss, td_errors = train(
+                    s1, a, r, s2, t, W=w, return_td_errors=True,
+                    trace_path=trace_path)
+        buffer.update_priorities(np.ravel(indices), np.ravel(td_errors))
+        return v_loss, q_loss, pi_loss
+
+    if fuse_train_steps:
+        # one sample of num_train_steps batches, run in one session call
+        with metrics.time('buffer_sample'):
+            sample = buffer.sample(num_train_steps * batch_size)
+            sample = [np.reshape(x, (num_train_steps, batch_size) + np.shape(x)[1:])
+                      for x in sample]
+        losses = train_on_sample(agent.train_steps, sample, metrics.trace_path())
     else:
-        env = gym.make(env)
+        for i in range(num_train_steps):
+            with metrics.time('buffer_sample'):
+                sample = buffer.sample(batch_size)
+            losses = train_on_sample(agent.train_step, sample, metrics.trace_path())
+    metrics.count('updates', num_train_steps)
+    v_loss, q_loss, pi_loss = losses
+    metrics.log(V_loss=np.mean(v_loss), Q_loss=np.mean(q_loss), pi_loss=np.mean(pi_loss))
+    return losses
+
 
-    s1 = env.reset()
+def run_training(env, buffer_size, reward_scale, batch_size, num_train_steps,
+                 buffer_dir=None, frame_buffer=False, num_envs=1,
+                 fuse_train_steps=False, prefetch_depth=0, prioritized=False,
+                 num_actors=0, sync_interval=100, max_staleness=1000,
+                 numpy_policy=False, metrics_path=None, metrics_flush_interval=10.,
+                 trace_dir=None, trace_interval=1000, graph_cache_dir=None,
+                 check_numerics=False, num_Q_heads=1, num_V_heads=1,
+                 Q_reduction='min', curiosity=None, intrinsic_weight=0.1,
+                 hindsight=False, relabel_prob=0.8, n_step=1, eval_interval=0,
+                 eval_episodes=10, seed=None, max_time_steps=0, intra_op_threads=0,
+                 inter_op_threads=0, num_learners=1, learner_rank=0,
+                 learner_address=None, export_dataset=None, dataset_chunk_size=100000,
+                 xla=False, compute_dtype='float32', actor_processes=False,
+                 normalize_observations=False, normalize_rewards=False,
+                 normalization_interval=1000, checkpoint_path=None):
+    config = dict(locals())
+    if frame_buffer and (num_envs > 1 or num_actors > 1):
+        raise ValueError('--frame-buffer needs consecutive transitions from a '
+                         'single env, so it cannot be used with --num-envs > 1 '
+                         'or --num-actors > 1')
+    if hindsight and (env != 'chaser' or num_actors > 1):
+        raise ValueError('--hindsight relabels the prey position of non-visual '
+                         'chaser observations and needs transitions appended '
+                         'in lockstep, so it requires --env chaser and '
+                         '--num-actors <= 1')
+    if n_step > 1 and num_actors > 1:
+        raise ValueError('--n-step needs transitions appended in lockstep, so it '
+                         'cannot be used with --num-actors > 1')
+    if n_step > 1 and curiosity is not None:
+        raise ValueError('--n-step stores s_{t+n} as the next state, which the '
+                         'one-step curiosity model would be trained on, so it '
+                         'cannot be used with --curiosity')
+    if actor_processes and num_actors == 0:
+        raise ValueError('--actor-processes needs --num-actors > 0')
+    if num_learners > 1 and num_actors > 0:
+        raise ValueError('--num-learners > 1 trains in lockstep with acting, so it '
+                         'cannot be used with --num-actors')
+    if check_numerics and (fuse_train_steps or num_learners > 1):
+        raise ValueError('--check-numerics only checks the single train step, so it '
+                         'cannot be used with --fuse-train-steps or --num-learners > 1')
+    if num_learners > 1 and graph_cache_dir is not None:
+        raise ValueError('--num-learners > 1 adds gradient ops that need the '
+                         'optimizers, which a cached graph does not have, so it '
+                         'cannot be used with --graph-cache-dir')
+    normalize = normalize_observations or normalize_rewards
+    if normalize and (num_learners > 1 or actor_processes):
+        raise ValueError('--normalize-observations and --normalize-rewards update '
+                         'their statistics from transitions appended in this '
+                         'process, so they cannot be used with --num-learners > 1 '
+                         'or --actor-processes')
 
-    agent = build_agent(env)
+    communicator = None
+    learners = []
+    if num_learners > 1:
+        if learner_address is None:
+            if learner_rank != 0:
+                raise ValueError('--learner-address is needed for rank > 0')
+            learner_address = ('localhost', 0)
+        communicator = Communicator(learner_rank, num_learners, learner_address)
+        if config['learner_address'] is None:
+            # no address given: run every rank on this machine
+            context = multiprocessing.get_context('spawn')
+            for rank in range(1, num_learners):
+                learners.append(context.Process(target=run_training, kwargs=dict(
+                    config, learner_rank=rank, learner_address=communicator.address)))
+                learners[-1].start()
+        communicator.connect()
+        # each rank collects its own replay shard
+        if seed is not None:
+            seed += learner_rank
+        if learner_rank > 0:
+            metrics_path = None if metrics_path is None else '%s.%s' % (
+                metrics_path, learner_rank)
+            trace_dir = None
+            eval_interval = 0
+            # rank 0 restores and saves the variables that every rank shares
+            checkpoint_path = None
+            export_dataset = None if export_dataset is None else '%s.%s' % (
+                export_dataset, learner_rank)
+
+    if seed is not None:
+        np.random.seed(seed)
+        tf.set_random_seed(seed)
+    env_name = env
+    env = make_vec_env(env_name, num_envs)
+    actor_envs = [env]
+    if num_actors > 1 and not actor_processes:
+        # forked env workers must not inherit the session's threads
+        actor_envs += [make_vec_env(env_name, num_envs) for _ in range(num_actors - 1)]
+
+    if metrics_path is None and trace_dir is None:
+        metrics = NullMetrics()
+    else:
+        metrics = Metrics(metrics_path, metrics_flush_interval, trace_dir,
+                          trace_interval)
+    evaluator = None
+    if eval_interval > 0:
+        # started before the agent's session exists, like the env workers
+        evaluator = EvaluationWorker(functools.partial(make_env, env_name),
+                                     build_action_converter, eval_episodes,
+                                     eval_interval, metrics)
+
+    agent = build_agent(env, num_Q_heads, num_V_heads, Q_reduction,
+                        curiosity, intrinsic_weight, compute_dtype,
+                        check_numerics=check_numerics,
+                        xla=xla,
+                        normalize_observations=normalize_observations,
+                        normalize_rewards=normalize_rewards,
+                        fused_train=fuse_train_steps,
+                        graph_cache_dir=graph_cache_dir,
+                        intra_op_threads=intra_op_threads,
+                        inter_op_threads=inter_op_threads)
+    if checkpoint_path is not None and os.path.exists(checkpoint_path + '.index'):
+        agent.restore(checkpoint_path)
+        print('Restored agent from %s' % checkpoint_path)
     action_converter = build_action_converter(env)
+    learner = agent
+    if communicator is not None:
+        learner = DataParallelLearner(agent, communicator)
 
-    buffer = ReplayBuffer2(buffer_size)
-    episode_reward = 0
-    episodes = 0
-    time_steps = 0
-    while True:
-        a = agent.sample_actions([s1])
-        a = a[0]
-        # s2, r, t, info = env.step(2*a)
-        # s2, r, t, info = env.step(np.argmax(a))
-        s2, r, t, info = env.step(action_converter(a))
-        time_steps += 1
-
-        episode_reward += r
-        # env.render()
-        r /= reward_scale
-        # print(s1)
-        buffer.append(s1, a, r, s2, t)
-        if len(buffer) >= batch_size:
-            for i in range(num_train_steps):
-                s1_sample, a_sample, r_sample, s2_sample, t_sample = \
-                        buffer.sample(batch_size)
-                [v_loss, q_loss, pi_loss] = agent.train_step(
-                        s1_sample, a_sample, r_sample, s2_sample, t_sample)
-                # print('v_loss', v_loss, 'q_loss', q_loss, 'pi_loss', pi_loss)
-        s1 = s2
-        if t:
-            s1 = env.reset()
+    buffer = replay = build_buffer(env, buffer_size, buffer_dir, frame_buffer,
+                                   prioritized, hindsight, relabel_prob, reward_scale,
+                                   n_step, agent.gamma, actor_processes)
+    if normalize:
+        # under the prefetching or locked wrapper, so appends stay serialized
+        buffer = StatisticsBuffer(replay, agent.update_normalization,
+                                  normalization_interval)
+    if prefetch_depth > 0:
+        sample_size = num_train_steps * batch_size if fuse_train_steps else batch_size
+        buffer = PrefetchingBuffer(buffer, sample_size, prefetch_depth)
+    elif num_actors > 0 and not actor_processes:
+        buffer = LockedBuffer(buffer)
+
+    counts = {'episodes': 0, 'time_steps': 0}
+    counts_lock = threading.Lock()
+
+    def end_episodes(num_steps, finished):
+        with counts_lock:
+            counts['time_steps'] += num_steps
+            if not finished:
+                return
+            if isinstance(replay, MemmapReplayBuffer):
+                replay.flush()
             # summary = tf.Summary()
             # summary.value.add(tag='episode reward', simple_value=episode_reward)
             # agent.tb_writer.add_summary(summary, episodes)
             # agent.tb_writer.flush()
-            print('Episode %s\t Time Steps: %s\t Reward: %s' % (episodes, time_steps, episode_reward))
-            episode_reward = 0
-            episodes += 1
+            for episode_reward in finished:
+                print('Episode %s\t Time Steps: %s\t Reward: %s' % (
+                    counts['episodes'], counts['time_steps'], episode_reward))
+                metrics.event('episode', episode=counts['episodes'],
+                              time_steps=counts['time_steps'],
+                              reward=float(episode_reward))
+                counts['episodes'] += 1
+            if prefetch_depth > 0:
+                print('Prefetch starved on %s of %s batches' % (buffer.starved, buffer.batches))
+                metrics.log(prefetch_starved=buffer.starved, prefetch_batches=buffer.batches)
+
+    def done():
+        return max_time_steps > 0 and counts['time_steps'] >= max_time_steps
+
+    def ready_to_train():
+        if communicator is None:
+            return len(buffer) >= batch_size
+        return learner.ready(len(buffer) >= batch_size)
+
+    try:
+        if actor_processes:
+            run_process_actor_learner(env_name, agent, replay, buffer, reward_scale,
+                                      batch_size, num_train_steps, fuse_train_steps,
+                                      num_actors, env.num_envs, sync_interval,
+                                      max_staleness, seed,
+                                      end_episodes, done, evaluator, metrics)
+            return
+        if num_actors > 0:
+            run_actor_learner(actor_envs, agent, action_converter, buffer,
+                              reward_scale, batch_size, num_train_steps,
+                              fuse_train_steps, prioritized, n_step, sync_interval, max_staleness, numpy_policy,
+                              end_episodes, done, evaluator, metrics)
+            return
+
+        sample_actions = agent.sample_actions
+        sync = None
+        if numpy_policy:
+            policy = NumpyPolicy.from_agent(agent)
+            sample_actions = policy.sample_actions
+            sync = PolicySync(lambda: policy.refresh(agent), sync_interval, max_staleness)
+        s1 = env.reset()
+        episode_rewards = np.zeros(num_envs)
+        while not done():
+            if sync is not None:
+                sync.actor_stepped()
+            s1, finished = step_envs(env, s1, sample_actions, action_converter,
+                                     buffer, reward_scale, episode_rewards, metrics)
+            if ready_to_train():
+                [v_loss, q_loss, pi_loss] = train_agent(
+                        learner, buffer, batch_size, num_train_steps,
+                        fuse_train_steps, prioritized, n_step, metrics)
+                # print('v_loss', v_loss, 'q_loss', q_loss, 'pi_loss', pi_loss)
+                if sync is not None:
+                    sync.learner_updated(num_train_steps)
+                if evaluator is not None:
+                    evaluator.learner_updated(agent, num_train_steps)
+            end_episodes(num_envs, finished)
+            metrics.maybe_flush()
+    finally:
+        if prefetch_depth > 0:
+            # the producer thread must stop sampling before replay is closed
+            buffer.close()
+        if isinstance(replay, MemmapReplayBuffer):
+            # keep the transitions of unfinished episodes for a resumed run
+            replay.flush()
+        if checkpoint_path is not None:
+            agent.save(checkpoint_path)
+            print('Saved agent to %s' % checkpoint_path)
+        if export_dataset is not None:
+            num_exported = export_buffer(replay, export_dataset, dataset_chunk_size,
+                                         space_attributes(env, n_step, reward_scale))
+            print('Exported %s transitions to %s' % (num_exported, export_dataset))
+        if evaluator is not None:
+            evaluator.close()
+        metrics.close()
+        if communicator is not None:
+            communicator.close()
+        for process in learners:
+            process.join()
+        if actor_processes:
+            replay.close()
+
+
+def run_offline_training(dataset_dir, batch_size, num_train_steps, num_updates,
+                         shuffle_window=100000, fuse_train_steps=False,
+                         prefetch_depth=0, metrics_path=None,
+                         metrics_flush_interval=10., trace_dir=None,
+                         trace_interval=1000, graph_cache_dir=None,
+                         check_numerics=False, num_Q_heads=1, num_V_heads=1,
+                         Q_reduction='min', curiosity=None, intrinsic_weight=0.1,
+                         seed=None, intra_op_threads=0, inter_op_threads=0,
+                         env=None, eval_interval=0, eval_episodes=10, xla=False,
+                         compute_dtype='float32', normalize_observations=False,
+                         normalize_rewards=False, checkpoint_path=None):
+    """
+    Trains for `num_updates` updates on batches streamed from the dataset in
+    `dataset_dir`, without an env in the loop. If `env` is given and
+    `eval_interval` is positive, the policy is evaluated in it as in
+    `run_training`. As there, the agent is restored from `checkpoint_path`
+    if it exists and saved there at the end, so an agent can be pretrained
+    here and fine-tuned online or vice versa. The normalization moments are
+    only updated from appended transitions, so here they keep their
+    restored values, and normalizing needs a checkpoint to restore.
+    """
+    if check_numerics and fuse_train_steps:
+        raise ValueError('--check-numerics only checks the single train step, so it '
+                         'cannot be used with --fuse-train-steps')
+    restore = checkpoint_path is not None and os.path.exists(checkpoint_path + '.index')
+    if (normalize_observations or normalize_rewards) and not restore:
+        raise ValueError('--normalize-observations and --normalize-rewards take '
+                         'their moments from a restored --checkpoint-path in '
+                         'offline training, as there are no appended transitions '
+                         'to update them from')
+    if seed is not None:
+        np.random.seed(seed)
+        tf.set_random_seed(seed)
+    dataset = buffer = StreamingDataset(dataset_dir, shuffle_window)
+    print('Training on %s transitions from %s' % (len(dataset), dataset_dir))
+    n_step = dataset.attributes.get('n_step', 1)
+    if n_step > 1 and curiosity is not None:
+        raise ValueError('The dataset in %s stores s_{t+n} as the next state, which '
+                         'the one-step curiosity model would be trained on, so it '
+                         'cannot be used with --curiosity' % dataset_dir)
+    if prefetch_depth > 0:
+        sample_size = num_train_steps * batch_size if fuse_train_steps else batch_size
+        buffer = PrefetchingBuffer(dataset, sample_size, prefetch_depth)
+
+    if metrics_path is None and trace_dir is None:
+        metrics = NullMetrics()
+    else:
+        metrics = Metrics(metrics_path, metrics_flush_interval, trace_dir,
+                          trace_interval)
+    evaluator = None
+    if env is not None and eval_interval > 0:
+        evaluator = EvaluationWorker(functools.partial(make_env, env),
+                                     build_action_converter, eval_episodes,
+                                     eval_interval, metrics)
+
+    agent = build_agent(dataset_env(dataset.attributes), num_Q_heads, num_V_heads,
+                        Q_reduction, curiosity, intrinsic_weight, compute_dtype,
+                        check_numerics=check_numerics,
+                        xla=xla,
+                        normalize_observations=normalize_observations,
+                        normalize_rewards=normalize_rewards,
+                        fused_train=fuse_train_steps,
+                        graph_cache_dir=graph_cache_dir,
+                        intra_op_threads=intra_op_threads,
+                        inter_op_threads=inter_op_threads)
+    if restore:
+        agent.restore(checkpoint_path)
+        print('Restored agent from %s' % checkpoint_path)
+    updates = 0
+    try:
+        while updates < num_updates:
+            v_loss, q_loss, pi_loss = train_agent(
+                    agent, buffer, batch_size, num_train_steps,
+                    fuse_train_steps, False, n_step, metrics)
+            updates += num_train_steps
+            if evaluator is not None:
+                evaluator.learner_updated(agent, num_train_steps)
+            metrics.maybe_flush()
+            if updates % 1000 < num_train_steps:
+                print('Updates %s\t Epochs: %s\t V loss: %s\t Q loss: %s\t pi loss: %s' % (
+                    updates, dataset.epochs, np.mean(v_loss), np.mean(q_loss),
+                    np.mean(pi_loss)))
+    finally:
+        if checkpoint_path is not None:
+            agent.save(checkpoint_path)
+            print('Saved agent to %s' % checkpoint_path)
+        if evaluator is not None:
+            evaluator.close()
+        metrics.close()
+        if prefetch_depth > 0:
+            buffer.close()
+    return agent
+
+
+def run_actor_learner(envs, agent, action_converter, buffer,
+                      reward_scale, batch_size, num_train_steps,
+                      fuse_train_steps, prioritized, n_step, sync_interval,
+                      max_staleness, numpy_policy, end_episodes, done, evaluator,
+                      metrics):
+    """
+    Collects experience in one thread per vec env in `envs`, each stepping
+    its envs with a copy of the policy kept fresh by a PolicySync, while
+    this thread trains continuously from the shared buffer until `done()`.
+    """
+    if numpy_policy:
+        policy = NumpyPolicy.from_agent(agent)
+        sample_actions = policy.sample_actions
+        sync = PolicySync(lambda: policy.refresh(agent), sync_interval, max_staleness)
+    else:
+        agent.build_actor_policy()
+        sample_actions = agent.sample_actor_actions
+        sync = PolicySync(agent.sync_actor_policy, sync_interval, max_staleness)
+    stop_event = threading.Event()
+    actors = [threading.Thread(target=act, daemon=True, args=(
+        actor_env, sample_actions, action_converter, buffer,
+        reward_scale, end_episodes, stop_event, sync.actor_stepped, metrics))
+        for actor_env in envs]
+    for actor in actors:
+        actor.start()
+    try:
+        while not done() and any(actor.is_alive() for actor in actors):
+            metrics.maybe_flush()
+            if len(buffer) < batch_size:
+                time.sleep(0.01)
+                continue
+            [v_loss, q_loss, pi_loss] = train_agent(
+                    agent, buffer, batch_size, num_train_steps,
+                    fuse_train_steps, prioritized, n_step, metrics)
+            sync.learner_updated(num_train_steps)
+            metrics.log(policy_staleness=sync.staleness())
+            if evaluator is not None:
+                evaluator.learner_updated(agent, num_train_steps)
+    finally:
+        stop_event.set()
+        for actor in actors:
+            actor.join()
+
+
+def run_process_actor_learner(env_name, agent, replay, buffer, reward_scale,
+                              batch_size, num_train_steps, fuse_train_steps,
+                              num_actors, num_envs, sync_interval, max_staleness,
+                              seed, end_episodes, done, evaluator, metrics):
+    """
+    Like `run_actor_learner`, but the actors are processes that append to
+    the SharedReplayBuffer `replay` directly. The learner samples through
+    `buffer`, which may wrap `replay` (e.g. for prefetching), and publishes
+    its `pi/` parameters whenever an actor's PolicySync asks for them,
+    so `sync_interval` and `max_staleness` mean what they do for threads.
+    """
+    from sac.shared_memory import SharedPolicyParams
+    # a fork of this process would inherit the session's threads
+    context = multiprocessing.get_context('spawn')
+    params = SharedPolicyParams(NumpyPolicy.snapshot(agent))
+    stop_event = context.Event()
+    episodes = context.Queue()
+    if seed is None:
+        seed = np.random.randint(2 ** 31 - num_actors)
+    actors = [context.Process(target=process_actor, args=(
+        env_name, num_envs, replay, params, reward_scale, stop_event, episodes,
+        seed + 1 + i, sync_interval, max_staleness)) for i in range(num_actors)]
+
+    def collect():
+        while True:
+            try:
+                num_steps, finished = episodes.get_nowait()
+            except queue.Empty:
+                return
+            end_episodes(num_steps, finished)
+
+    updates = 0
+    try:
+        for actor in actors:
+            actor.start()
+        while not done() and any(actor.is_alive() for actor in actors):
+            collect()
+            metrics.maybe_flush()
+            if len(buffer) < batch_size:
+                time.sleep(0.01)
+                continue
+            [v_loss, q_loss, pi_loss] = train_agent(
+                    agent, buffer, batch_size, num_train_steps,
+                    fuse_train_steps, False, 1, metrics)
+            updates += num_train_steps
+            params.set_learner_updates(updates)
+            if params.requested():
+                params.publish(NumpyPolicy.snapshot(agent), updates)
+            metrics.log(policy_staleness=updates - params.published_updates())
+            if evaluator is not None:
+                evaluator.learner_updated(agent, num_train_steps)
+    finally:
+        stop_event.set()
+        # an actor cannot exit while its reports are still in the queue's pipe
+        for actor in actors:
+            while actor.is_alive():
+                collect()
+                actor.join(0.1)
+        collect()
+        params.close()
 
 
 if __name__ == '__main__':
@@ -93,9 +624,225 @@ if __name__ == '__main__':
     parser.add_argument('--num-train-steps', default=1, type=int)
     parser.add_argument('--batch-size', default=32, type=int)
     parser.add_argument('--reward-scale', default=1/10., type=float)
+    parser.add_argument('--buffer-dir', default=None,
+                        help='keep the replay buffer in memory-mapped files '
+                             'here, resuming from them if they exist')
+    parser.add_argument('--frame-buffer', action='store_true',
+                        help='store each pixel observation once, as uint8')
+    parser.add_argument('--num-envs', default=1, type=int,
+                        help='number of envs to step in parallel, each gym env '
+                             'in its own worker process')
+    parser.add_argument('--fuse-train-steps', action='store_true',
+                        help='run all --num-train-steps updates (and target '
+                             'updates) in a single session call')
+    parser.add_argument('--prefetch-depth', default=0, type=int,
+                        help='number of batches to sample ahead in a '
+                             'background thread (0 to sample inline)')
+    parser.add_argument('--prioritized', action='store_true',
+                        help='sample transitions in proportion to their TD '
+                             'error, with importance-weighted Q updates')
+    parser.add_argument('--num-actors', default=0, type=int,
+                        help='collect experience in this many actor threads '
+                             'while training continuously (0 to alternate '
+                             'acting and training on one thread)')
+    parser.add_argument('--sync-interval', default=100, type=int,
+                        help='actor steps between refreshes of the actors\' '
+                             'copy of the policy')
+    parser.add_argument('--max-staleness', default=1000, type=int,
+                        help='most learner updates the actors\' policy may '
+                             'lag behind before it is refreshed')
+    parser.add_argument('--numpy-policy', action='store_true',
+                        help='act with a NumPy snapshot of the policy, '
+                             'refreshed like the actors\' copy')
+    parser.add_argument('--metrics-path', default=None,
+                        help='append per-phase timings, rates, losses and '
+                             'episode rewards here as JSON lines')
+    parser.add_argument('--metrics-flush-interval', default=10., type=float,
+                        help='seconds between metrics lines')
+    parser.add_argument('--trace-dir', default=None,
+                        help='write full session traces of sampled train '
+                             'steps here')
+    parser.add_argument('--trace-interval', default=1000, type=int,
+                        help='updates between traced train steps')
+    parser.add_argument('--graph-cache-dir', default=None,
+                        help='reuse agent graphs exported here by earlier runs '
+                             'with the same env shapes and options')
+    parser.add_argument('--check-numerics', action='store_true',
+                        help='debug mode: check every tensor for NaN/Inf on '
+                             'each train step')
+    parser.add_argument('--num-q-heads', default=1, type=int,
+                        help='size of the Q ensemble, evaluated as one batched '
+                             'network')
+    parser.add_argument('--num-v-heads', default=1, type=int,
+                        help='size of the V (and V_bar) ensemble')
+    parser.add_argument('--q-reduction', default='min', choices=['min', 'mean', 'max'],
+                        help='how Q heads are combined in the V and pi losses')
+    parser.add_argument('--curiosity', default=None, choices=['forward', 'inverse'],
+                        help='add an intrinsic reward from the error of a forward '
+                             'model on raw states, or of an inverse-model-trained '
+                             'feature space')
+    parser.add_argument('--intrinsic-weight', default=0.1, type=float,
+                        help='weight of the intrinsic reward; the env reward '
+                             'gets one minus this')
+    parser.add_argument('--hindsight', action='store_true',
+                        help='relabel chaser goals with future agent positions '
+                             'of the same episode when sampling')
+    parser.add_argument('--relabel-prob', default=0.8, type=float,
+                        help='fraction of sampled transitions relabeled by --hindsight')
+    parser.add_argument('--n-step', default=1, type=int,
+                        help='store n-step returns, bootstrapping from the state '
+                             'n steps later (or the terminal state)')
+    parser.add_argument('--eval-interval', default=0, type=int,
+                        help='evaluate the deterministic policy in a separate '
+                             'process every this many updates (0 disables)')
+    parser.add_argument('--eval-episodes', default=10, type=int,
+                        help='number of episodes per evaluation')
+    parser.add_argument('--seed', default=None, type=int)
+    parser.add_argument('--max-time-steps', default=0, type=int,
+                        help='stop after this many env steps (0 runs forever)')
+    parser.add_argument('--intra-op-threads', default=0, type=int,
+                        help='threads TensorFlow uses within an op (0 for all cores)')
+    parser.add_argument('--inter-op-threads', default=0, type=int,
+                        help='threads TensorFlow uses to run ops in parallel '
+                             '(0 for all cores)')
+    parser.add_argument('--num-learners', default=1, type=int,
+                        help='train synchronously in this many processes, each '
+                             'with its own envs and replay shard, averaging '
+                             'gradients every step')
+    parser.add_argument('--learner-rank', default=0, type=int,
+                        help='rank of this process when --learner-address is given')
+    parser.add_argument('--learner-address', default=None,
+                        help='host:port that rank 0 listens on, to run ranks '
+                             'separately (e.g. on several machines); without it '
+                             'all ranks are started on this machine')
+    parser.add_argument('--export-dataset', default=None,
+                        help='when training ends, write the replay buffer to a '
+                             'chunked dataset in this directory')
+    parser.add_argument('--dataset-chunk-size', default=100000, type=int,
+                        help='transitions per chunk of --export-dataset')
+    parser.add_argument('--offline-dataset', default=None,
+                        help='train only on the dataset in this directory, '
+                             'without stepping --env (used for evaluation only)')
+    parser.add_argument('--offline-updates', default=1000000, type=int,
+                        help='number of updates of --offline-dataset training')
+    parser.add_argument('--shuffle-window', default=100000, type=int,
+                        help='transitions held in memory to shuffle the '
+                             'streamed --offline-dataset')
+    parser.add_argument('--xla', action='store_true',
+                        help='compile the training and sampling ops with XLA')
+    parser.add_argument('--compute-dtype', default='float32',
+                        choices=['float32', 'float16', 'bfloat16'],
+                        help='dtype of the hidden layers of the MLPs; weights, '
+                             'outputs and losses stay float32')
+    parser.add_argument('--actor-processes', action='store_true',
+                        help='run the --num-actors actors as processes that '
+                             'append to a shared-memory replay buffer')
+    parser.add_argument('--normalize-observations', action='store_true',
+                        help='standardize observations in the graph with '
+                             'running moments of appended transitions')
+    parser.add_argument('--normalize-rewards', action='store_true',
+                        help='divide rewards by their running standard '
+                             'deviation in the graph, after --reward-scale')
+    parser.add_argument('--normalization-interval', default=1000, type=int,
+                        help='transitions per update of the running moments')
+    parser.add_argument('--checkpoint-path', default=None,
+                        help='restore the agent from this checkpoint if it '
+                             'exists, and save it there when training ends')
+    parser.add_argument('--cpus', default=None,
+                        help='comma-separated CPU ids to pin this process to')
     args = parser.parse_args()
-    run_training(env=args.env,
-                 buffer_size=args.buffer_size,
-                 reward_scale=args.reward_scale,
-                 batch_size=args.batch_size,
-                 num_train_steps=args.num_train_steps)
+    if args.cpus is not None:
+        # before the session exists, so its thread pools inherit the affinity
+        os.sched_setaffinity(0, [int(cpu) for cpu in args.cpus.split(',')])
+    if args.offline_dataset is not None:
+        # options of the online loop, which offline training would ignore
+        online_only = ['buffer_size', 'reward_scale', 'buffer_dir', 'frame_buffer',
+                       'num_envs', 'prioritized', 'num_actors', 'sync_interval',
+                       'max_staleness', 'numpy_policy', 'hindsight', 'relabel_prob',
+                       'n_step', 'max_time_steps', 'num_learners', 'learner_rank',
+                       'learner_address', 'export_dataset', 'dataset_chunk_size',
+                       'actor_processes', 'normalization_interval']
+        ignored = [name for name in online_only
+                   if getattr(args, name) != parser.get_default(name)]
+        if ignored:
+            parser.error('--offline-dataset cannot be used with %s' % ', '.join(
+                '--' + name.replace('_', '-') for name in ignored))
+        run_offline_training(dataset_dir=args.offline_dataset,
+                             batch_size=args.batch_size,
+                             num_train_steps=args.num_train_steps,
+                             num_updates=args.offline_updates,
+                             shuffle_window=args.shuffle_window,
+                             fuse_train_steps=args.fuse_train_steps,
+                             prefetch_depth=args.prefetch_depth,
+                             metrics_path=args.metrics_path,
+                             metrics_flush_interval=args.metrics_flush_interval,
+                             trace_dir=args.trace_dir,
+                             trace_interval=args.trace_interval,
+                             graph_cache_dir=args.graph_cache_dir,
+                             check_numerics=args.check_numerics,
+                             num_Q_heads=args.num_q_heads,
+                             num_V_heads=args.num_v_heads,
+                             Q_reduction=args.q_reduction,
+                             curiosity=args.curiosity,
+                             intrinsic_weight=args.intrinsic_weight,
+                             seed=args.seed,
+                             intra_op_threads=args.intra_op_threads,
+                             inter_op_threads=args.inter_op_threads,
+                             env=args.env,
+                             eval_interval=args.eval_interval,
+                             eval_episodes=args.eval_episodes,
+                             xla=args.xla,
+                             compute_dtype=args.compute_dtype,
+                             normalize_observations=args.normalize_observations,
+                             normalize_rewards=args.normalize_rewards,
+                             checkpoint_path=args.checkpoint_path)
+    else:
+        run_training(env=args.env,
+                     buffer_size=args.buffer_size,
+                     reward_scale=args.reward_scale,
+                     batch_size=args.batch_size,
+                     num_train_steps=args.num_train_steps,
+                     buffer_dir=args.buffer_dir,
+                     frame_buffer=args.frame_buffer,
+                     num_envs=args.num_envs,
+                     fuse_train_steps=args.fuse_train_steps,
+                     prefetch_depth=args.prefetch_depth,
+                     prioritized=args.prioritized,
+                     num_actors=args.num_actors,
+                     sync_interval=args.sync_interval,
+                     max_staleness=args.max_staleness,
+                     numpy_policy=args.numpy_policy,
+                     metrics_path=args.metrics_path,
+                     metrics_flush_interval=args.metrics_flush_interval,
+                     trace_dir=args.trace_dir,
+                     trace_interval=args.trace_interval,
+                     graph_cache_dir=args.graph_cache_dir,
+                     check_numerics=args.check_numerics,
+                     num_Q_heads=args.num_q_heads,
+                     num_V_heads=args.num_v_heads,
+                     Q_reduction=args.q_reduction,
+                     curiosity=args.curiosity,
+                     intrinsic_weight=args.intrinsic_weight,
+                     hindsight=args.hindsight,
+                     relabel_prob=args.relabel_prob,
+                     n_step=args.n_step,
+                     eval_interval=args.eval_interval,
+                     eval_episodes=args.eval_episodes,
+                     seed=args.seed,
+                     max_time_steps=args.max_time_steps,
+                     intra_op_threads=args.intra_op_threads,
+                     inter_op_threads=args.inter_op_threads,
+                     num_learners=args.num_learners,
+                     learner_rank=args.learner_rank,
+                     learner_address=None if args.learner_address is None else (
+                         args.learner_address.rsplit(':', 1)[0],
+                         int(args.learner_address.rsplit(':', 1)[1])),
+                     export_dataset=args.export_dataset,
+                     dataset_chunk_size=args.dataset_chunk_size,
+                     xla=args.xla,
+                     compute_dtype=args.compute_dtype,
+                     actor_processes=args.actor_processes,
+                     normalize_observations=args.normalize_observations,
+                     normalize_rewards=args.normalize_rewards,
+                     normalization_interval=args.normalization_interval,
+                     checkpoint_path=args.checkpoint_path)
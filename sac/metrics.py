@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+
+class NullMetrics(object):
+    """
+    Stand-in for Metrics when instrumentation is disabled. Every method is a
+    no-op, so the training loop can call them unconditionally.
+    """
+
+    def __init__(self):
+        self.null_context = nullcontext()
+
+    def time(self, phase):
+        return self.null_context
+
+    def count(self, name, n=1):
+        pass
+
+    def log(self, **values):
+        pass
+
+    def event(self, kind, **values):
+        pass
+
+    def trace_path(self):
+        return None
+
+    def maybe_flush(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Metrics(object):
+    """
+    Accumulates time spent per phase, counters and the latest logged values
+    over a window, and every `flush_interval` seconds appends the window to
+    `path` as one JSON line, with counters turned into per-second rates.
+    Events (e.g. finished episodes) are written as their own lines
+    immediately. All methods may be called from several threads.
+
+    If `trace_dir` is set, `trace_path` hands out a file for a full
+    RunMetadata trace of the train step once every `trace_interval` updates.
+    """
+
+    def __init__(self, path=None, flush_interval=10., trace_dir=None,
+                 trace_interval=1000):
+        self.file = None if path is None else open(path, 'a')
+        self.flush_interval = flush_interval
+        self.trace_dir = trace_dir
+        self.trace_interval = trace_interval
+        self.next_trace = 0
+        if trace_dir is not None:
+            os.makedirs(trace_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.totals = defaultdict(int)
+        self.start_window()
+
+    def start_window(self):
+        self.window_start = time.time()
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counts = defaultdict(int)
+        self.values = {}
+
+    @contextmanager
+    def time(self, phase):
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.seconds[phase] += elapsed
+            self.calls[phase] += 1
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+            self.totals[name] += n
+
+    def log(self, **values):
+        with self.lock:
+            self.values.update({k: float(v) for (k, v) in values.items()})
+
+    def event(self, kind, **values):
+        self.write(dict(values, type=kind, time=time.time()))
+
+    def trace_path(self):
+        if self.trace_dir is None:
+            return None
+        with self.lock:
+            updates = self.totals['updates']
+            if updates < self.next_trace:
+                return None
+            self.next_trace = updates + self.trace_interval
+        return os.path.join(self.trace_dir, 'train_step_%s.json' % updates)
+
+    def maybe_flush(self):
+        if time.time() - self.window_start >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            now = time.time()
+            elapsed = now - self.window_start
+            record = {
+                'type': 'window',
+                'time': now,
+                'elapsed': elapsed,
+                'seconds': dict(self.seconds),
+                'calls': dict(self.calls),
+                'per_sec': {k: v / elapsed for (k, v) in self.counts.items()},
+                'totals': dict(self.totals),
+                'values': self.values,
+            }
+            self.start_window()
+        self.write(record)
+
+    def write(self, record):
+        if self.file is None:
+            return
+        line = json.dumps(record)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
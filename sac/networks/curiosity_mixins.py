@@ -0,0 +1,50 @@
+import tensorflow as tf
+
+
+class ForwardModelCuriosity(object):
+    '''
+    Forward dynamics model that predicts s2 - s1 from (s1, a). Its squared
+    prediction error is the intrinsic reward of the transition.
+    '''
+    intrinsic_weight = 0.1
+
+    def curiosity(self, s1, a, s2, name, reuse=None):
+        with tf.variable_scope(name, reuse=reuse):
+            s1, s2 = tf.layers.flatten(s1), tf.layers.flatten(s2)
+            sa = tf.concat([s1, a], axis=1)
+            fc1 = tf.layers.dense(sa, 128, tf.nn.relu, name='fc1')
+            fc2 = tf.layers.dense(fc1, 128, tf.nn.relu, name='fc2')
+            delta = tf.layers.dense(fc2, s1.get_shape()[1].value, name='delta')
+            error = 0.5 * tf.reduce_mean(tf.square(delta - (s2 - s1)), axis=1)
+        return error, tf.reduce_mean(error)
+
+
+class InverseModelCuriosity(object):
+    '''
+    Intrinsic curiosity module: an encoder is trained through an inverse
+    model that predicts a from the features of (s1, s2), and a forward model
+    predicts the features of s2 from those of s1 and a. The forward model's
+    error in feature space is the intrinsic reward, so state changes that
+    the agent cannot influence are ignored.
+    '''
+    intrinsic_weight = 0.1
+
+    def encode(self, s, reuse):
+        with tf.variable_scope('encoder', reuse=reuse):
+            fc1 = tf.layers.dense(tf.layers.flatten(s), 128, tf.nn.relu, name='fc1')
+            return tf.layers.dense(fc1, 64, tf.nn.relu, name='features')
+
+    def curiosity(self, s1, a, s2, name, reuse=None):
+        with tf.variable_scope(name, reuse=reuse):
+            phi1 = self.encode(s1, reuse)
+            phi2 = self.encode(s2, True)
+            with tf.variable_scope('inverse'):
+                fc = tf.layers.dense(tf.concat([phi1, phi2], axis=1), 128, tf.nn.relu, name='fc1')
+                a_pred = tf.layers.dense(fc, a.get_shape()[1].value, name='a')
+            inverse_loss = tf.reduce_mean(0.5 * tf.square(a_pred - a))
+            with tf.variable_scope('forward'):
+                fc = tf.layers.dense(tf.concat([tf.stop_gradient(phi1), a], axis=1),
+                                     128, tf.nn.relu, name='fc1')
+                phi2_pred = tf.layers.dense(fc, 64, name='features')
+            error = 0.5 * tf.reduce_mean(tf.square(phi2_pred - tf.stop_gradient(phi2)), axis=1)
+        return error, tf.reduce_mean(error) + inverse_loss
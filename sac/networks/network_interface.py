@@ -1,75 +1,544 @@
+import hashlib
+import json
+import os
+import sys
+from contextlib import nullcontext
+
 import tensorflow as tf
 import numpy as np
+from tensorflow.python.client import timeline
 from abc import abstractmethod
 
+from sac.networks.normalization import running_moments, update_moments, normalize
+
 
 class AbstractSoftActorCritic(object):
 
-    def __init__(self, s_shape, a_shape):
-        self.S1 = S1 = tf.placeholder(tf.float32, [None] + list(s_shape))
-        self.S2 = S2 = tf.placeholder(tf.float32, [None] + list(s_shape))
-        self.A = A = tf.placeholder(tf.float32, [None] + list(a_shape))
+    # attributes holding graph elements, restored by name from a cached graph
+    graph_tensors = ['S1', 'S2', 'A', 'R', 'T', 'W', 'D', 'A_sampled', 'TD', 'V_loss',
+                     'Q_loss', 'pi_loss', 'soft_update_xi_bar', 'hard_update_xi_bar',
+                     'train_V', 'train_Q', 'train_pi', 'train_and_soft_update',
+                     'Q_mean', 'Q_variance', 'intrinsic_reward', 'curiosity_loss',
+                     'train_curiosity', 'statistics_S', 'statistics_R',
+                     'update_statistics']
+    graph_variables = ['phi', 'theta', 'xi', 'xi_bar', 'curiosity_vars',
+                       'observation_moments', 'reward_moments']
+
+    def __init__(self, s_shape, a_shape, check_numerics=False, fused_train=False,
+                 graph_cache_dir=None, intra_op_threads=0, inter_op_threads=0,
+                 xla=False, normalize_observations=False, normalize_rewards=False):
+        """
+        `check_numerics` adds (and runs with every train step) a check for
+        NaN/Inf in every float tensor, and prints the variable lists; it is
+        meant for debugging. `fused_train` builds the loop behind
+        `train_steps` up front. With `graph_cache_dir`, the constructed graph
+        is exported there, keyed by the agent's mixins, shapes and options,
+        and later agents with the same key import it instead of rebuilding.
+        `intra_op_threads` and `inter_op_threads` size the session's thread
+        pools (0 lets TensorFlow use every core). `xla` compiles the training
+        and sampling ops with XLA, fusing the many small ops of the networks
+        and losses. `normalize_observations` standardizes observations, and
+        `normalize_rewards` divides rewards by their standard deviation,
+        in the graph, with running moments that `update_statistics` folds
+        batches of transitions into.
+        """
+        self.s_shape = list(s_shape)
+        self.a_shape = list(a_shape)
+        self.gamma = 0.99
+        self.tau = 0.01
+        self.debug = check_numerics
+        self.check = None
+        self.fused_train = None
+        self.gradient_train = None
+        self.graph_options = {'check_numerics': check_numerics,
+                              'fused_train': fused_train,
+                              'xla': xla,
+                              'normalize_observations': normalize_observations,
+                              'normalize_rewards': normalize_rewards}
+
+        cache_path = None
+        if graph_cache_dir is not None:
+            cache_path = os.path.join(graph_cache_dir, self.graph_key())
+        if cache_path is not None and os.path.exists(cache_path + '.meta'):
+            self.load_graph(cache_path)
+        else:
+            self.build_graph()
+            if fused_train:
+                self.build_fused_train()
+            if cache_path is not None:
+                self.save_graph(cache_path)
+
+        config = tf.ConfigProto(allow_soft_placement=True,
+                                intra_op_parallelism_threads=intra_op_threads,
+                                inter_op_parallelism_threads=inter_op_threads)
+        config.gpu_options.allow_growth = True
+        self.sess = sess = tf.Session(config=config)
+        sess.run(tf.global_variables_initializer())
+        # ensure that xi and xi_bar are the same at initialization
+        sess.run(self.hard_update_xi_bar)
+
+    def build_graph(self):
+        s_shape, a_shape = self.s_shape, self.a_shape
+        self.S1 = S1 = tf.placeholder(tf.float32, [None] + s_shape)
+        self.S2 = S2 = tf.placeholder(tf.float32, [None] + s_shape)
+        self.A = A = tf.placeholder(tf.float32, [None] + a_shape)
         self.R = R = tf.placeholder(tf.float32, [None])
         self.T = T = tf.placeholder(tf.float32, [None])
-        gamma = 0.99
-        tau = 0.01
+        # importance weights for the Q loss, uniform unless fed
+        self.W = W = tf.placeholder_with_default(tf.ones_like(R), [None])
+        # discount of V_bar(S2), gamma unless fed (e.g. gamma ** n for n-step returns)
+        self.D = D = tf.placeholder_with_default(self.gamma * tf.ones_like(R), [None])
         learning_rate = 3*10**-4
+        self.build_statistics()
 
-        # constructing V loss
+        with self.jit_scope():
+            losses = self.build_losses(S1, A, R, S2, T, W, D)
+        self.A_sampled = losses['A_sampled']
+        self.TD = losses['TD']
+        self.V_loss, self.Q_loss, self.pi_loss = losses['V_loss'], losses['Q_loss'], losses['pi_loss']
+        self.intrinsic_reward = losses['intrinsic_reward']
+        self.curiosity_loss = losses['curiosity_loss']
+        # spread of the Q heads at (S1, A), for ensembles
+        self.Q_mean, self.Q_variance = tf.nn.moments(
+            self.Q_heads(self.normalize_observations(S1), self.transform_action_sample(A),
+                         'Q', reuse=True), axes=[0])
+
+        # grabbing all the relevant variables
+        self.phi = phi = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope='pi/')
+        self.theta = theta = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope='Q/')
+        self.xi = xi = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope='V/')
+        self.xi_bar = xi_bar = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope='V_bar/')
+        self.curiosity_vars = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope='curiosity/')
+
+        if self.debug:
+            print('\nphi', phi)
+            print('\ntheta', theta)
+            print('\nxi', xi)
+            print('\nxi_bar', xi_bar)
 
-        self.A_sampled = A_sampled = tf.stop_gradient(self.sample_pi_network(a_shape[0], S1, 'pi'))
-        V_S1 = self.V_network(S1, 'V')
-        Q_sampled = self.Q_network(S1, self.transform_action_sample(A_sampled), 'Q')
+        self.soft_update_xi_bar = tf.group(*self.soft_update_xi_bar_ops())
+        hard_update_xi_bar_ops = [tf.assign(xbar, x) for (xbar, x) in zip(xi_bar, xi)]
+        self.hard_update_xi_bar = tf.group(*hard_update_xi_bar_ops)
+
+        self.V_optimizer = tf.train.AdamOptimizer(learning_rate=learning_rate)
+        self.Q_optimizer = tf.train.AdamOptimizer(learning_rate=learning_rate)
+        self.pi_optimizer = tf.train.AdamOptimizer(learning_rate=learning_rate)
+        self.curiosity_optimizer = tf.train.AdamOptimizer(learning_rate=learning_rate)
+        with self.jit_scope():
+            train_ops = self.minimize_losses(losses)
+            self.train_V, self.train_Q, self.train_pi = train_ops[:3]
+            self.train_curiosity = train_ops[3] if len(train_ops) > 3 else None
+            # the target update has to read xi after this step's update of it
+            with tf.control_dependencies(train_ops):
+                self.train_and_soft_update = tf.group(*self.soft_update_xi_bar_ops())
+        if self.debug:
+            self.check = tf.add_check_numerics_ops()
+        # after the check, which would otherwise need the statistics fed too
+        self.build_statistics_update()
+
+    def build_statistics(self):
+        """
+        Creates the running moments of observations and rewards that are
+        enabled, under `normalization/`.
+        """
+        self.observation_moments, self.reward_moments = [], []
+        with tf.variable_scope('normalization'):
+            if self.graph_options['normalize_observations']:
+                self.observation_moments = running_moments('observation', self.s_shape)
+            if self.graph_options['normalize_rewards']:
+                self.reward_moments = running_moments('reward', [])
+
+    def build_statistics_update(self):
+        """
+        Builds the op that folds a batch fed to `statistics_S` and
+        `statistics_R` into the running moments.
+        """
+        self.statistics_S = self.statistics_R = self.update_statistics = None
+        if not (self.observation_moments or self.reward_moments):
+            return
+        self.statistics_S = tf.placeholder(tf.float32, [None] + self.s_shape)
+        self.statistics_R = tf.placeholder(tf.float32, [None])
+        updates = []
+        if self.observation_moments:
+            updates.append(update_moments(self.observation_moments, self.statistics_S))
+        if self.reward_moments:
+            updates.append(update_moments(self.reward_moments, self.statistics_R))
+        self.update_statistics = tf.group(*updates)
+
+    def normalize_observations(self, S):
+        if not self.observation_moments:
+            return S
+        return normalize(S, self.observation_moments)
+
+    def normalize_rewards(self, R):
+        if not self.reward_moments:
+            return R
+        return normalize(R, self.reward_moments, center=False)
+
+    def jit_scope(self):
+        """ Marks the ops built within it for XLA compilation if `xla` is set. """
+        if not self.graph_options['xla']:
+            return nullcontext()
+        from tensorflow.contrib.compiler import jit
+        return jit.experimental_jit_scope()
+
+    def graph_key(self):
+        # the graph depends on the code of every mixin and of the helpers in
+        # sac/networks they use (e.g. precision.py), so hash all of them
+        paths = set(getattr(sys.modules[cls.__module__], '__file__', None)
+                    for cls in type(self).__mro__)
+        networks_dir = os.path.dirname(os.path.abspath(__file__))
+        paths.update(os.path.join(networks_dir, name) for name in os.listdir(networks_dir))
+        sources = hashlib.sha1()
+        for path in sorted(path for path in paths if path is not None and path.endswith('.py')):
+            with open(path, 'rb') as f:
+                sources.update(f.read())
+        # class attributes set on the concrete agent (e.g. ensemble sizes)
+        attributes = {k: v for (k, v) in vars(type(self)).items()
+                      if isinstance(v, (bool, int, float, str))}
+        # the random ops of an exported graph keep the seeds they were built
+        # with, so tf.set_random_seed would not affect a cache hit
+        seed = tf.get_default_graph().seed
+        key = json.dumps([[cls.__name__ for cls in type(self).__mro__], attributes,
+                          self.s_shape, self.a_shape, self.graph_options, seed,
+                          tf.__version__, sources.hexdigest()], sort_keys=True)
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def save_graph(self, path):
+        names = {
+            'tensors': {attr: getattr(self, attr).name
+                        for attr in self.graph_tensors if getattr(self, attr) is not None},
+            'variables': {attr: [var.name for var in getattr(self, attr)]
+                          for attr in self.graph_variables},
+            'check': None if self.check is None else self.check.name,
+            'fused_train': None,
+        }
+        if self.fused_train is not None:
+            names['fused_train'] = {
+                'placeholders': [x.name for x in self.fused_train['placeholders']],
+                'W': self.fused_train['W'].name,
+                'D': self.fused_train['D'].name,
+                'losses': [x.name for x in self.fused_train['losses']],
+                'TD': self.fused_train['TD'].name,
+            }
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # concurrent jobs may share the cache, so only ever rename complete
+        # files into place, the .meta last since its presence marks a hit
+        tmp_suffix = '.%s.tmp' % os.getpid()
+        with open(path + '.json' + tmp_suffix, 'w') as f:
+            json.dump(names, f)
+        os.replace(path + '.json' + tmp_suffix, path + '.json')
+        tf.train.export_meta_graph(filename=path + '.meta' + tmp_suffix,
+                                   clear_devices=True)
+        os.replace(path + '.meta' + tmp_suffix, path + '.meta')
+
+    def load_graph(self, path):
+        tf.train.import_meta_graph(path + '.meta')
+        with open(path + '.json') as f:
+            names = json.load(f)
+        graph = tf.get_default_graph()
+        variables = {var.name: var for var in tf.global_variables()}
+
+        def lookup(name):
+            if ':' in name:
+                return graph.get_tensor_by_name(name)
+            return graph.get_operation_by_name(name)
+
+        for attr in self.graph_tensors:
+            name = names['tensors'].get(attr)
+            setattr(self, attr, None if name is None else lookup(name))
+        for attr, var_names in names['variables'].items():
+            setattr(self, attr, [variables[name] for name in var_names])
+        if names['check'] is not None:
+            self.check = lookup(names['check'])
+        if names['fused_train'] is not None:
+            fused = names['fused_train']
+            self.fused_train = {
+                'placeholders': [lookup(name) for name in fused['placeholders']],
+                'W': lookup(fused['W']),
+                'D': lookup(fused['D']),
+                'losses': [lookup(name) for name in fused['losses']],
+                'TD': lookup(fused['TD']),
+            }
+        # the optimizers only exist as ops in an imported graph
+        self.V_optimizer = self.Q_optimizer = self.pi_optimizer = None
+        self.curiosity_optimizer = None
+
+    def build_losses(self, S1, A, R, S2, T, W, D, reuse=None):
+        S1, S2 = self.normalize_observations(S1), self.normalize_observations(S2)
+        R = self.normalize_rewards(R)
+        # constructing V loss
+        # every head is regressed onto the same target, so the losses sum over
+        # the leading head axis of V_heads/Q_heads
+        A_sampled = tf.stop_gradient(self.sample_pi_network(self.a_shape[0], S1, 'pi', reuse=reuse))
+        V_S1_heads = self.V_heads(S1, 'V', reuse=reuse)
+        V_S1 = self.reduce_heads(V_S1_heads, 'mean')
+        Q_sampled = self.reduce_heads(self.Q_heads(
+            S1, self.transform_action_sample(A_sampled), 'Q', reuse=reuse), self.Q_reduction)
         log_pi_sampled = self.pi_network_log_prob(A_sampled, S1, 'pi', reuse=True)
-        self.V_loss = V_loss = tf.reduce_mean(0.5*tf.square(V_S1 - (Q_sampled - log_pi_sampled)))
+        V_loss = tf.reduce_mean(tf.reduce_sum(
+            0.5*tf.square(V_S1_heads - (Q_sampled - log_pi_sampled)), axis=0))
 
         # constructing Q loss
-        V_bar_S2 = self.V_network(S2, 'V_bar')
-        Q = self.Q_network(S1, self.transform_action_sample(A), 'Q', reuse=True)
-        self.Q_loss = Q_loss = tf.reduce_mean(0.5*tf.square(Q - (R + (1 - T) * gamma * V_bar_S2)))
+        V_bar_S2 = self.reduce_heads(self.V_heads(S2, 'V_bar', reuse=reuse), 'mean')
+        Q = self.Q_heads(S1, self.transform_action_sample(A), 'Q', reuse=True)
+        # mix in the curiosity reward, computed for the whole batch from the
+        # current model rather than stored when the transition was collected
+        intrinsic_reward = curiosity_loss = None
+        curiosity = self.curiosity(S1, self.transform_action_sample(A), S2, 'curiosity', reuse=reuse)
+        if curiosity is not None:
+            intrinsic_reward, curiosity_loss = curiosity
+            R = (1 - self.intrinsic_weight) * R + \
+                self.intrinsic_weight * tf.stop_gradient(intrinsic_reward)
+        TD_heads = Q - (R + (1 - T) * D * V_bar_S2)
+        Q_loss = tf.reduce_mean(tf.reduce_sum(W * 0.5*tf.square(TD_heads), axis=0))
+        TD = tf.reduce_mean(TD_heads, axis=0)
 
         # constructing pi loss
-        self.pi_loss = pi_loss = tf.reduce_mean(log_pi_sampled * tf.stop_gradient(log_pi_sampled - Q_sampled + V_S1))
+        pi_loss = tf.reduce_mean(log_pi_sampled * tf.stop_gradient(log_pi_sampled - Q_sampled + V_S1))
+        return {'A_sampled': A_sampled, 'V_loss': V_loss, 'Q_loss': Q_loss,
+                'pi_loss': pi_loss, 'TD': TD, 'intrinsic_reward': intrinsic_reward,
+                'curiosity_loss': curiosity_loss}
 
-        # grabbing all the relevant variables
-        phi = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope='pi/')
-        theta = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope='Q/')
-        xi = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope='V/')
-        xi_bar = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope='V_bar/')
-
-        print('\nphi', phi)
-        print('\ntheta', theta)
-        print('\nxi', xi)
-        print('\nxi_bar', xi_bar)
-
-        soft_update_xi_bar_ops = [tf.assign(xbar, tau*x + (1 - tau)*xbar) for (xbar, x) in zip(xi_bar, xi)]
-        self.soft_update_xi_bar = soft_update_xi_bar = tf.group(*soft_update_xi_bar_ops)
-        hard_update_xi_bar_ops = [tf.assign(xbar, x) for (xbar, x) in zip(xi_bar, xi)]
-        hard_update_xi_bar = tf.group(*hard_update_xi_bar_ops)
+    def minimize_losses(self, losses):
+        train_ops = [self.V_optimizer.minimize(losses['V_loss'], var_list=self.xi),
+                     self.Q_optimizer.minimize(losses['Q_loss'], var_list=self.theta),
+                     self.pi_optimizer.minimize(losses['pi_loss'], var_list=self.phi)]
+        if losses['curiosity_loss'] is not None:
+            train_ops.append(self.curiosity_optimizer.minimize(
+                losses['curiosity_loss'], var_list=self.curiosity_vars))
+        return train_ops
 
-        self.train_V = train_V = tf.train.AdamOptimizer(learning_rate=learning_rate).minimize(V_loss, var_list=xi)
-        self.train_Q = train_Q = tf.train.AdamOptimizer(learning_rate=learning_rate).minimize(Q_loss, var_list=theta)
-        self.train_pi = train_pi = tf.train.AdamOptimizer(learning_rate=learning_rate).minimize(pi_loss, var_list=phi)
-        self.check = tf.add_check_numerics_ops()
+    def reduce_heads(self, heads, reduction):
+        if reduction == 'min':
+            return tf.reduce_min(heads, axis=0)
+        elif reduction == 'mean':
+            return tf.reduce_mean(heads, axis=0)
+        elif reduction == 'max':
+            return tf.reduce_max(heads, axis=0)
+        raise ValueError('Unknown reduction %s' % reduction)
 
-        config = tf.ConfigProto(allow_soft_placement=True)
-        config.gpu_options.allow_growth = True
-        self.sess = sess = tf.Session(config=config)
-        sess.run(tf.global_variables_initializer())
-        # ensure that xi and xi_bar are the same at initialization
-        sess.run(hard_update_xi_bar)
+    def soft_update_xi_bar_ops(self):
+        return [tf.assign(xbar, self.tau*x + (1 - self.tau)*xbar)
+                for (xbar, x) in zip(self.xi_bar, self.xi)]
+
+    def build_fused_train(self):
+        """
+        Builds a tf.while_loop that takes a stack of K batches and runs K
+        V/Q/pi updates, each followed by the soft update of V_bar, in a
+        single session call. The optimizers' slots already exist, so the
+        loop creates no new variables.
+        """
+        if self.fused_train is not None:
+            return
+        if self.V_optimizer is None:
+            raise ValueError('This agent was loaded from a cached graph built '
+                             'without fused_train=True, so its training loop '
+                             'cannot be added')
+        S1s = tf.placeholder(tf.float32, [None, None] + self.s_shape)
+        S2s = tf.placeholder(tf.float32, [None, None] + self.s_shape)
+        As = tf.placeholder(tf.float32, [None, None] + self.a_shape)
+        Rs = tf.placeholder(tf.float32, [None, None])
+        Ts = tf.placeholder(tf.float32, [None, None])
+        Ws = tf.placeholder_with_default(tf.ones_like(Rs), [None, None])
+        Ds = tf.placeholder_with_default(self.gamma * tf.ones_like(Rs), [None, None])
+        num_steps = tf.shape(Rs)[0]
+
+        def body(i, V_losses, Q_losses, pi_losses, TDs):
+            with self.jit_scope():
+                losses = self.build_losses(S1s[i], As[i], Rs[i], S2s[i], Ts[i], Ws[i], Ds[i],
+                                           reuse=True)
+                V_loss, Q_loss, pi_loss, TD = [losses[k] for k in ['V_loss', 'Q_loss', 'pi_loss', 'TD']]
+                train_ops = self.minimize_losses(losses)
+                with tf.control_dependencies(train_ops):
+                    soft_update = tf.group(*self.soft_update_xi_bar_ops())
+            # the next step may only read parameters once this one is done
+            with tf.control_dependencies([soft_update]):
+                next_i = i + 1
+            return (next_i, V_losses.write(i, V_loss), Q_losses.write(i, Q_loss),
+                    pi_losses.write(i, pi_loss), TDs.write(i, TD))
+
+        outputs = [tf.TensorArray(tf.float32, size=num_steps) for _ in range(4)]
+        _, V_losses, Q_losses, pi_losses, TDs = tf.while_loop(
+            lambda i, *_: i < num_steps, body, [tf.constant(0)] + outputs,
+            parallel_iterations=1)
+        self.fused_train = {
+            'placeholders': (S1s, As, Rs, S2s, Ts),
+            'W': Ws,
+            'D': Ds,
+            'losses': [V_losses.stack(), Q_losses.stack(), pi_losses.stack()],
+            'TD': TDs.stack(),
+        }
+
+    def build_gradient_train(self):
+        """
+        Splits the train step in two: ops that compute the gradients of the
+        V, Q, pi (and curiosity) losses for a batch, and ops that apply
+        gradients fed from outside with the same optimizers, followed by the
+        soft update of V_bar. Processes that average their gradients in
+        between take identical steps (see sac/data_parallel.py).
+        """
+        if self.gradient_train is not None:
+            return
+        if self.V_optimizer is None:
+            raise ValueError('This agent was loaded from a cached graph, so its '
+                             'optimizers cannot be used to apply gradients')
+        existing = set(tf.global_variables())
+        terms = [(self.V_optimizer, self.V_loss, self.xi),
+                 (self.Q_optimizer, self.Q_loss, self.theta),
+                 (self.pi_optimizer, self.pi_loss, self.phi)]
+        if self.curiosity_loss is not None:
+            terms.append((self.curiosity_optimizer, self.curiosity_loss, self.curiosity_vars))
+        gradients, placeholders, apply_ops = [], [], []
+        with self.jit_scope():
+            for optimizer, loss, var_list in terms:
+                grads = tf.gradients(loss, var_list)
+                grads = [tf.zeros_like(var) if grad is None else grad
+                         for (grad, var) in zip(grads, var_list)]
+                feeds = [tf.placeholder(var.dtype.base_dtype, var.get_shape()) for var in var_list]
+                apply_ops.append(optimizer.apply_gradients(zip(feeds, var_list)))
+                gradients += grads
+                placeholders += feeds
+            with tf.control_dependencies(apply_ops):
+                apply_and_soft_update = tf.group(*self.soft_update_xi_bar_ops())
+        # the optimizers reuse their slots, but initialize anything new
+        self.sess.run(tf.variables_initializer(
+            [var for var in tf.global_variables() if var not in existing]))
+        self.gradient_train = {'gradients': gradients, 'placeholders': placeholders,
+                               'apply': apply_and_soft_update}
+
+    def compute_gradients(self, S1, A, R, S2, T, W=None, D=None, trace_path=None):
+        """
+        Returns the gradients of the losses for a batch, without applying
+        them, followed by the V, Q and pi losses and the per-sample TD errors.
+        """
+        if self.gradient_train is None:
+            self.build_gradient_train()
+        feed_dict = {self.S1: S1, self.A: A, self.R: R, self.S2: S2, self.T: T}
+        if W is not None:
+            feed_dict[self.W] = W
+        if D is not None:
+            feed_dict[self.D] = D
+        gradients, V_loss, Q_loss, pi_loss, TD = self.run(
+            [self.gradient_train['gradients'], self.V_loss, self.Q_loss,
+             self.pi_loss, self.TD], feed_dict, trace_path)
+        return gradients, V_loss, Q_loss, pi_loss, TD
+
+    def apply_gradients(self, gradients):
+        feed_dict = dict(zip(self.gradient_train['placeholders'], gradients))
+        self.sess.run(self.gradient_train['apply'], feed_dict=feed_dict)
+
+    def update_normalization(self, S, R):
+        """
+        Folds a batch of observations and (scaled) rewards into the running
+        moments, if the agent normalizes either.
+        """
+        if self.update_statistics is not None:
+            self.sess.run(self.update_statistics,
+                          feed_dict={self.statistics_S: S, self.statistics_R: R})
+
+    def save(self, path):
+        """
+        Writes a checkpoint of every variable, including the optimizers'
+        slots and the normalization moments, to `path`.
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tf.train.Saver().save(self.sess, path)
 
-    def train_step(self, S1, A, R, S2, T):
-        [_, _, _, V_loss, Q_loss, pi_loss] = self.sess.run(
-            [self.train_V, self.train_Q, self.train_pi, self.V_loss, self.Q_loss, self.pi_loss],
-            feed_dict={self.S1: S1, self.A: A, self.R: R, self.S2: S2, self.T: T})
-        self.sess.run(self.soft_update_xi_bar)
-        return V_loss, Q_loss, pi_loss
+    def restore(self, path):
+        tf.train.Saver().restore(self.sess, path)
+
+    def get_variables(self):
+        return self.sess.run(tf.global_variables())
+
+    def set_variables(self, values):
+        for var, value in zip(tf.global_variables(), values):
+            var.load(value, self.sess)
+
+    def run(self, fetches, feed_dict, trace_path=None):
+        """
+        `sess.run`, optionally recording a full trace of the call and writing
+        it to `trace_path` in Chrome trace format.
+        """
+        if trace_path is None:
+            return self.sess.run(fetches, feed_dict=feed_dict)
+        options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+        run_metadata = tf.RunMetadata()
+        result = self.sess.run(fetches, feed_dict=feed_dict, options=options,
+                               run_metadata=run_metadata)
+        with open(trace_path, 'w') as f:
+            f.write(timeline.Timeline(run_metadata.step_stats).generate_chrome_trace_format())
+        return result
+
+    def train_step(self, S1, A, R, S2, T, W=None, D=None, return_td_errors=False,
+                   trace_path=None):
+        """
+        `W` optionally weights each sample's Q loss (e.g. importance weights
+        from prioritized replay), and `D` replaces gamma as the per-sample
+        discount of the bootstrapped value (e.g. for n-step returns). With
+        `return_td_errors`, the per-sample TD errors of the Q network are
+        returned after the losses. With `trace_path`, a timeline of the step
+        is written there.
+        """
+        feed_dict = {self.S1: S1, self.A: A, self.R: R, self.S2: S2, self.T: T}
+        if W is not None:
+            feed_dict[self.W] = W
+        if D is not None:
+            feed_dict[self.D] = D
+        fetches = [self.train_and_soft_update, self.V_loss, self.Q_loss, self.pi_loss]
+        if return_td_errors:
+            fetches.append(self.TD)
+        if self.check is not None:
+            fetches.append(self.check)
+            return tuple(self.run(fetches, feed_dict, trace_path)[1:-1])
+        return tuple(self.run(fetches, feed_dict, trace_path)[1:])
+
+    def train_steps(self, S1, A, R, S2, T, W=None, D=None, return_td_errors=False,
+                    trace_path=None):
+        """
+        Runs one update per leading index of the stacked batches (each of
+        shape [K, batch_size, ...]) in one session call, and returns the
+        V, Q and pi losses of every step as arrays of length K. The other
+        arguments are as in `train_step`, stacked the same way.
+        """
+        if self.fused_train is None:
+            self.build_fused_train()
+        placeholders = self.fused_train['placeholders']
+        feed_dict = dict(zip(placeholders, [S1, A, R, S2, T]))
+        if W is not None:
+            feed_dict[self.fused_train['W']] = W
+        if D is not None:
+            feed_dict[self.fused_train['D']] = D
+        fetches = list(self.fused_train['losses'])
+        if return_td_errors:
+            fetches.append(self.fused_train['TD'])
+        return tuple(self.run(fetches, feed_dict, trace_path))
 
     def sample_actions(self, S1):
         actions = self.sess.run(self.A_sampled, feed_dict={self.S1: S1})
         return actions
 
+    def build_actor_policy(self):
+        """
+        Builds a copy of the policy under `pi_actor/` that actors can sample
+        from while the learner keeps updating `pi/`, along with the op that
+        refreshes the copy from `pi/`.
+        """
+        with self.jit_scope():
+            self.A_sampled_actor = tf.stop_gradient(self.sample_pi_network(
+                self.a_shape[0], self.normalize_observations(self.S1), 'pi_actor'))
+        actor_vars = tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES, scope='pi_actor/')
+        self.sync_actor = tf.group(*[tf.assign(actor_var, var)
+                                     for (actor_var, var) in zip(actor_vars, self.phi)])
+        self.sess.run(tf.variables_initializer(actor_vars))
+        self.sess.run(self.sync_actor)
+
+    def sync_actor_policy(self):
+        self.sess.run(self.sync_actor)
+
+    def sample_actor_actions(self, S1):
+        return self.sess.run(self.A_sampled_actor, feed_dict={self.S1: S1})
+
     @abstractmethod
     def Q_network(self, s, a, name, reuse=None):
         pass
@@ -78,6 +547,23 @@ class AbstractSoftActorCritic(object):
     def V_network(self, s, name, reuse=None):
         pass
 
+    # curiosity mixins override this to return the per-sample intrinsic
+    # reward of (s1, a, s2) and the loss of their model
+    intrinsic_weight = 0.
+
+    def curiosity(self, s1, a, s2, name, reuse=None):
+        return None
+
+    # value functions with several heads override these to return
+    # [num_heads, batch]; a single network is an ensemble of one
+    Q_reduction = 'mean'
+
+    def Q_heads(self, s, a, name, reuse=None):
+        return tf.expand_dims(self.Q_network(s, a, name, reuse), 0)
+
+    def V_heads(self, s, name, reuse=None):
+        return tf.expand_dims(self.V_network(s, name, reuse), 0)
+
     @abstractmethod
     def input_processing(self, s):
         pass
@@ -0,0 +1,52 @@
+import tensorflow as tf
+
+# shared with NumpyPolicy, which applies the same normalization in NumPy
+EPSILON = 1e-8
+CLIP = 10.
+
+
+def running_moments(name, shape):
+    """
+    Creates the non-trainable variables [mean, variance, count] holding the
+    running moments of a quantity of shape `shape`. They start out as the
+    identity normalization, with a tiny count so the first batch dominates.
+    """
+    with tf.variable_scope(name):
+        mean = tf.get_variable('mean', shape, tf.float64, tf.zeros_initializer(),
+                               trainable=False)
+        variance = tf.get_variable('variance', shape, tf.float64, tf.ones_initializer(),
+                                   trainable=False)
+        count = tf.get_variable('count', [], tf.float64, tf.constant_initializer(1e-4),
+                                trainable=False)
+    return [mean, variance, count]
+
+
+def update_moments(moments, batch):
+    """
+    Returns an op that folds the moments of `batch` (along its first axis)
+    into `moments`, combining them as in Chan et al.'s parallel algorithm.
+    """
+    mean, variance, count = moments
+    batch_mean, batch_variance = tf.nn.moments(tf.cast(batch, tf.float64), axes=[0])
+    batch_count = tf.cast(tf.shape(batch)[0], tf.float64)
+    total = count + batch_count
+    delta = batch_mean - mean
+    new_mean = mean + delta * batch_count / total
+    new_variance = (variance * count + batch_variance * batch_count +
+                    tf.square(delta) * count * batch_count / total) / total
+    # every new value has to be computed from the old ones before assigning
+    with tf.control_dependencies([new_mean, new_variance, total]):
+        return tf.group(tf.assign(mean, new_mean), tf.assign(variance, new_variance),
+                        tf.assign(count, total))
+
+
+def normalize(x, moments, center=True):
+    """
+    Standardizes `x` with `moments`, clipped to [-CLIP, CLIP]. Without
+    `center` it is only divided by the standard deviation, which keeps the
+    sign of rewards.
+    """
+    mean, variance, _ = [tf.cast(moment, x.dtype) for moment in moments]
+    if center:
+        x = x - mean
+    return tf.clip_by_value(x / tf.sqrt(variance + EPSILON), -CLIP, CLIP)
@@ -0,0 +1,94 @@
+import numpy as np
+
+
+class NumpyPolicy(object):
+    """
+    Session-free copy of an agent's `pi/` network for MLPPolicy combined with
+    GaussianPolicy or CategoricalPolicy. The forward pass and sampling are
+    done in NumPy and follow the TF graph: Gaussian samples are returned
+    before the tanh squashing, categorical samples as one-hot vectors.
+
+    The parameters are a snapshot: call `refresh` to pull the current values
+    from the session. `save` writes them to a .npz file that `load` can read
+    back without TensorFlow. If the agent normalizes observations, the
+    snapshot includes the moments and the policy applies them the way the
+    graph does.
+    """
+
+    def __init__(self, params):
+        if 'logits/kernel' in params:
+            self.kind = 'categorical'
+        elif 'mu_params/kernel' in params:
+            self.kind = 'gaussian'
+        else:
+            raise ValueError('Unsupported policy parameters: %s' % sorted(params))
+        self.params = params
+
+    # as in sac/networks/normalization.py
+    epsilon = 1e-8
+    clip = 10.
+
+    @staticmethod
+    def snapshot(agent):
+        variables = agent.phi + agent.observation_moments
+        values = agent.sess.run(variables)
+        # 'pi/fc1/kernel:0' -> 'fc1/kernel',
+        # 'normalization/observation/mean:0' -> 'observation/mean'
+        names = [var.name.split(':')[0].split('/', 1)[1] for var in variables]
+        return dict(zip(names, values))
+
+    @classmethod
+    def from_agent(cls, agent):
+        return cls(cls.snapshot(agent))
+
+    def refresh(self, agent):
+        # swap in a whole new dict so concurrent callers never see a mix
+        self.params = self.snapshot(agent)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls({name: f[name] for name in f.files})
+
+    def save(self, path):
+        np.savez(path, **self.params)
+
+    def dense(self, params, x, name):
+        return np.matmul(x, params[name + '/kernel']) + params[name + '/bias']
+
+    def policy_parameters(self, S1):
+        params = self.params
+        x = np.asarray(S1, dtype=np.float32)
+        if 'observation/mean' in params:
+            std = np.sqrt(params['observation/variance'] + self.epsilon)
+            x = np.clip((x - params['observation/mean']) / std,
+                        -self.clip, self.clip).astype(np.float32)
+        x = np.maximum(self.dense(params, x, 'fc1'), 0)
+        x = np.maximum(self.dense(params, x, 'fc2'), 0)
+        if self.kind == 'categorical':
+            return self.dense(params, x, 'logits')
+        mu = self.dense(params, x, 'mu_params')
+        sigma = 1 / (1 + np.exp(-self.dense(params, x, 'sigma_params')))
+        return mu, sigma + 0.0001
+
+    def sample_actions(self, S1):
+        parameters = self.policy_parameters(S1)
+        if self.kind == 'categorical':
+            # Gumbel-max sampling from softmax(logits)
+            logits = parameters
+            uniform = np.random.uniform(np.finfo(np.float32).tiny, 1., size=logits.shape)
+            gumbel = -np.log(-np.log(uniform))
+            return self.onehot(np.argmax(logits + gumbel, axis=-1), logits.shape[-1])
+        mu, sigma = parameters
+        return (mu + sigma * np.random.standard_normal(mu.shape)).astype(np.float32)
+
+    def deterministic_actions(self, S1):
+        parameters = self.policy_parameters(S1)
+        if self.kind == 'categorical':
+            return self.onehot(np.argmax(parameters, axis=-1), parameters.shape[-1])
+        mu, _ = parameters
+        return mu
+
+    def onehot(self, indices, num_entries):
+        return np.eye(num_entries, dtype=np.float32)[indices]
+
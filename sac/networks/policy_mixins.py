@@ -2,17 +2,23 @@ import tensorflow as tf
 import numpy as np
 from abc import abstractmethod
 
+from sac.networks.precision import compute_precision
+
 EPS = 1E-6
 
 def leaky_relu(x, alpha=0.2):
     return tf.maximum(x, alpha*x)
 
 class MLPPolicy(object):
+    # dtype of the hidden layers; weights and outputs stay float32
+    compute_dtype = 'float32'
 
     def input_processing(self, s):
-        fc1 = tf.layers.dense(s, 128, tf.nn.relu, name='fc1')
-        fc2 = tf.layers.dense(fc1, 128, tf.nn.relu, name='fc2')
-        return fc2
+        with compute_precision(self.compute_dtype):
+            x = tf.cast(s, self.compute_dtype)
+            fc1 = tf.layers.dense(x, 128, tf.nn.relu, name='fc1')
+            fc2 = tf.layers.dense(fc1, 128, tf.nn.relu, name='fc2')
+        return tf.cast(fc2, tf.float32)
 
 
 class GaussianPolicy(object):
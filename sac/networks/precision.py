@@ -0,0 +1,30 @@
+from contextlib import contextmanager
+
+import tensorflow as tf
+
+
+def master_weights_getter(getter, name, shape=None, dtype=None, *args, **kwargs):
+    """
+    Custom getter that always creates float32 variables and hands layers
+    that ask for another dtype a cast of them, so the optimizers update
+    float32 master weights while the layers compute in reduced precision.
+    """
+    variable = getter(name, shape, tf.float32, *args, **kwargs)
+    if dtype is not None and dtype != tf.float32:
+        return tf.cast(variable, dtype)
+    return variable
+
+
+@contextmanager
+def compute_precision(dtype):
+    """
+    Within this context, layers created in the current variable scope keep
+    float32 variables but may compute in `dtype` (e.g. 'float16' or
+    'bfloat16'). For float32 it adds nothing to the graph.
+    """
+    if tf.as_dtype(dtype) == tf.float32:
+        yield
+        return
+    with tf.variable_scope(tf.get_variable_scope(), custom_getter=master_weights_getter,
+                           auxiliary_name_scope=False):
+        yield
@@ -1,4 +1,5 @@
 from sac.networks import network_interface
+from sac.networks.precision import compute_precision
 import tensorflow as tf
 import numpy as np
 
@@ -7,22 +8,75 @@ def leaky_relu(x, alpha=0.2):
     return tf.maximum(x, alpha*x)
 
 class MLPValueFunc(object):
+    # dtype of the hidden layers; weights and outputs stay float32
+    compute_dtype = 'float32'
 
     def Q_network(self, s, a, name, reuse=None):
         with tf.variable_scope(name, reuse=reuse):
             sa = tf.concat([s, a], axis=1)
             print(s, a)
             print(sa)
-            fc1 = tf.layers.dense(sa, 128, tf.nn.relu, name='fc1')
-            fc2 = tf.layers.dense(fc1, 128, tf.nn.relu, name='fc2')
-            q = tf.reshape(tf.layers.dense(fc2, 1, name='q'), [-1])
+            with compute_precision(self.compute_dtype):
+                x = tf.cast(sa, self.compute_dtype)
+                fc1 = tf.layers.dense(x, 128, tf.nn.relu, name='fc1')
+                fc2 = tf.layers.dense(fc1, 128, tf.nn.relu, name='fc2')
+            q = tf.reshape(tf.layers.dense(tf.cast(fc2, tf.float32), 1, name='q'), [-1])
         return q
 
     def V_network(self, s, name, reuse=None):
         with tf.variable_scope(name, reuse=reuse):
-            fc1 = tf.layers.dense(s, 128, tf.nn.relu, name='fc1')
-            fc2 = tf.layers.dense(fc1, 128, tf.nn.relu, name='fc2')
-            v = tf.reshape(tf.layers.dense(fc2, 1, name='v'), [-1])
+            with compute_precision(self.compute_dtype):
+                x = tf.cast(s, self.compute_dtype)
+                fc1 = tf.layers.dense(x, 128, tf.nn.relu, name='fc1')
+                fc2 = tf.layers.dense(fc1, 128, tf.nn.relu, name='fc2')
+            v = tf.reshape(tf.layers.dense(tf.cast(fc2, tf.float32), 1, name='v'), [-1])
         return v
 
 
+class EnsembleMLPValueFunc(object):
+    """
+    Q and V networks made of ensembles of MLP heads with the same layout as
+    MLPValueFunc. The weights of all heads are stacked along a leading axis
+    and evaluated with one batched matmul per layer, so the ensemble adds no
+    ops over a single network. `Q_heads`/`V_heads` return [num_heads, batch];
+    `Q_network`/`V_network` reduce them with `Q_reduction` (e.g. 'min' for
+    clipped double-Q) and the mean respectively. Like MLPValueFunc, the
+    hidden layers compute in `compute_dtype`.
+    """
+    num_Q_heads = 2
+    num_V_heads = 1
+    Q_reduction = 'min'
+    compute_dtype = 'float32'
+
+    def ensemble_dense(self, x, units, activation, name):
+        num_heads, in_dim = x.get_shape()[0].value, x.get_shape()[2].value
+        limit = np.sqrt(6. / (in_dim + units))
+        # within compute_precision these are float32 variables cast to x's dtype
+        kernel = tf.get_variable(name + '/kernel', [num_heads, in_dim, units], x.dtype,
+                                 initializer=tf.random_uniform_initializer(-limit, limit))
+        bias = tf.get_variable(name + '/bias', [num_heads, 1, units], x.dtype,
+                               initializer=tf.zeros_initializer())
+        y = tf.matmul(x, kernel) + bias
+        return y if activation is None else activation(y)
+
+    def ensemble_mlp(self, x, num_heads, output_name):
+        with compute_precision(self.compute_dtype):
+            h = tf.tile(tf.expand_dims(tf.cast(x, self.compute_dtype), 0), [num_heads, 1, 1])
+            fc1 = self.ensemble_dense(h, 128, tf.nn.relu, 'fc1')
+            fc2 = self.ensemble_dense(fc1, 128, tf.nn.relu, 'fc2')
+        output = self.ensemble_dense(tf.cast(fc2, tf.float32), 1, None, output_name)
+        return tf.squeeze(output, axis=2)
+
+    def Q_heads(self, s, a, name, reuse=None):
+        with tf.variable_scope(name, reuse=reuse):
+            return self.ensemble_mlp(tf.concat([s, a], axis=1), self.num_Q_heads, 'q')
+
+    def V_heads(self, s, name, reuse=None):
+        with tf.variable_scope(name, reuse=reuse):
+            return self.ensemble_mlp(s, self.num_V_heads, 'v')
+
+    def Q_network(self, s, a, name, reuse=None):
+        return self.reduce_heads(self.Q_heads(s, a, name, reuse), self.Q_reduction)
+
+    def V_network(self, s, name, reuse=None):
+        return self.reduce_heads(self.V_heads(s, name, reuse), 'mean')
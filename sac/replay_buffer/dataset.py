@@ -0,0 +1,155 @@
+import json
+import os
+
+import numpy as np
+
+from sac.replay_buffer.replay_buffer import FrameReplayBuffer
+
+
+class DatasetWriter(object):
+    """
+    Writes transitions to `directory` as a chunked columnar dataset: chunk i
+    is a directory `chunk_<i>` holding one .npy file per column (S1, A, R,
+    S2, T and optionally D) with `chunk_size` rows. `meta.json` lists the
+    columns, the chunk sizes and free-form `attributes` (e.g. the spaces of
+    the env), and is rewritten after every chunk, so a dataset is readable
+    up to its last complete chunk while it is being written.
+    """
+
+    def __init__(self, directory, chunk_size=100000, attributes=None):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.attributes = attributes or {}
+        self.columns = None
+        self.chunks = []
+        self.pending = []
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, columns):
+        """ Appends a batch of transitions, given as a dict of column arrays. """
+        if self.columns is None:
+            self.columns = {name: {'shape': list(np.shape(values)[1:]),
+                                   'dtype': np.asarray(values).dtype.str}
+                            for (name, values) in columns.items()}
+        self.pending.append({name: np.asarray(values) for (name, values) in columns.items()})
+        while sum(len(batch['R']) for batch in self.pending) >= self.chunk_size:
+            self.write_chunk(self.take(self.chunk_size))
+
+    def take(self, size):
+        merged = {name: np.concatenate([batch[name] for batch in self.pending])
+                  for name in self.columns}
+        rest = {name: values[size:] for (name, values) in merged.items()}
+        self.pending = [rest] if len(rest['R']) else []
+        return {name: values[:size] for (name, values) in merged.items()}
+
+    def write_chunk(self, columns):
+        chunk_dir = os.path.join(self.directory, 'chunk_%05d' % len(self.chunks))
+        os.makedirs(chunk_dir, exist_ok=True)
+        for name, values in columns.items():
+            np.save(os.path.join(chunk_dir, name + '.npy'), values)
+        self.chunks.append(len(columns['R']))
+        self.write_meta()
+
+    def write_meta(self):
+        meta = {'columns': self.columns, 'chunks': self.chunks,
+                'size': sum(self.chunks), 'attributes': self.attributes}
+        tmp_path = os.path.join(self.directory, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.directory, 'meta.json'))
+
+    def close(self):
+        if self.pending:
+            self.write_chunk(self.take(sum(len(batch['R']) for batch in self.pending)))
+        elif not self.chunks:
+            self.write_meta()
+
+
+def export_buffer(buffer, directory, chunk_size=100000, attributes=None):
+    """
+    Writes the transitions held by a replay buffer, oldest first, to a
+    dataset in `directory`. Frame buffers are exported with their stacked
+    frames; buffers that store a per-sample discount also export it as D.
+    """
+    writer = DatasetWriter(directory, chunk_size, attributes)
+    if isinstance(buffer, FrameReplayBuffer):
+        indices = (buffer.oldest + np.arange(len(buffer))) % buffer.maxlen
+
+        def gather(idx):
+            return {'S1': buffer.get_frames(buffer.S1[idx]), 'A': buffer.A[idx],
+                    'R': buffer.R[idx], 'S2': buffer.get_frames(buffer.S2[idx]),
+                    'T': buffer.T[idx]}
+    else:
+        start = buffer.pos if buffer.full else 0
+        indices = (start + np.arange(len(buffer))) % buffer.maxlen
+        names = ['S1', 'A', 'R', 'S2', 'T'] + (['D'] if hasattr(buffer, 'D') else [])
+
+        def gather(idx):
+            return {name: getattr(buffer, name)[idx] for name in names}
+    for i in range(0, len(indices), chunk_size):
+        writer.write(gather(indices[i:i + chunk_size]))
+    writer.close()
+    return len(indices)
+
+
+class StreamingDataset(object):
+    """
+    Samples batches from a dataset written by DatasetWriter without loading
+    it into memory. Chunks are memory-mapped one at a time, in a new random
+    order every epoch, and read sequentially into a shuffle window of
+    `shuffle_window` transitions. `sample` draws a batch from the window and
+    refills the drawn slots with the next transitions of the stream, so
+    batches mix transitions from about shuffle_window / chunk_size chunks.
+
+    `sample` returns S1, A, R, S2, T (and D if the dataset has it), so it can
+    stand in for a replay buffer when training.
+    """
+
+    def __init__(self, directory, shuffle_window=100000):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if not self.meta['size']:
+            raise ValueError('Dataset in %s is empty' % directory)
+        self.names = [name for name in ['S1', 'A', 'R', 'S2', 'T', 'D']
+                      if name in self.meta['columns']]
+        self.attributes = self.meta['attributes']
+        self.shuffle_window = min(shuffle_window, self.meta['size'])
+        self.epochs = 0
+        self.stream = self.read_stream()
+        self.chunk, self.offset = None, 0
+        self.window = None
+
+    def read_stream(self):
+        while True:
+            for chunk in np.random.permutation(len(self.meta['chunks'])):
+                chunk_dir = os.path.join(self.directory, 'chunk_%05d' % chunk)
+                yield {name: np.load(os.path.join(chunk_dir, name + '.npy'), mmap_mode='r')
+                       for name in self.names}
+            self.epochs += 1
+
+    def read(self, size):
+        """ Returns the next `size` transitions of the stream as arrays. """
+        parts = []
+        while size > 0:
+            if self.chunk is None or self.offset >= len(self.chunk['R']):
+                self.chunk, self.offset = next(self.stream), 0
+            end = min(self.offset + size, len(self.chunk['R']))
+            parts.append({name: np.array(values[self.offset:end])
+                          for (name, values) in self.chunk.items()})
+            size -= end - self.offset
+            self.offset = end
+        return {name: np.concatenate([part[name] for part in parts]) for name in self.names}
+
+    def sample(self, batch_size):
+        if self.window is None:
+            self.window = self.read(self.shuffle_window)
+        indices = np.random.randint(0, self.shuffle_window, size=batch_size)
+        batch = tuple(self.window[name][indices] for name in self.names)
+        incoming = self.read(batch_size)
+        for name in self.names:
+            self.window[name][indices] = incoming[name]
+        return batch
+
+    def __len__(self):
+        return self.meta['size']
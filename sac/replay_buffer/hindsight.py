@@ -0,0 +1,79 @@
+import numpy as np
+
+from sac.replay_buffer.replay_buffer import ArrayReplayBuffer
+
+
+class HindsightReplayBuffer(ArrayReplayBuffer):
+    """
+    Goal-conditioned ArrayReplayBuffer that relabels goals when batches are
+    sampled ("future" strategy of hindsight experience replay). With
+    probability `relabel_prob` the goal part of s1 and s2 is replaced by the
+    achieved goal of s2 at a uniformly drawn later step of the same episode,
+    and the reward and terminal are recomputed with
+    `goal_reward(achieved_goals, goals) -> (rewards, reached)`. Only the
+    original transitions are stored.
+
+    Transitions of `num_streams` environments may be interleaved as long as
+    they are appended in lockstep (one per env per step, in env order), as
+    `step_envs` does: an episode then occupies every `num_streams`-th slot.
+    For each stored transition the buffer keeps the absolute index of the
+    last transition of its episode, or -1 while the episode is running.
+    """
+
+    def __init__(self, maxlen, s_shape, a_shape, achieved_goal, goal, goal_reward,
+                 relabel_prob=0.8, reward_scale=1., num_streams=1):
+        super(HindsightReplayBuffer, self).__init__(maxlen, s_shape, a_shape)
+        self.achieved_goal = achieved_goal
+        self.goal = goal
+        self.goal_reward = goal_reward
+        self.relabel_prob = relabel_prob
+        self.reward_scale = reward_scale
+        self.num_streams = num_streams
+        self.index = np.zeros(maxlen, dtype=np.int64)
+        self.episode_end = np.full(maxlen, -1, dtype=np.int64)
+        self.episode_start = np.zeros(num_streams, dtype=np.int64)
+        self.count = 0
+
+    def append(self, s1, a, r, s2, t):
+        i, pos = self.count, self.pos
+        super(HindsightReplayBuffer, self).append(s1, a, r, s2, t)
+        self.index[pos] = i
+        self.episode_end[pos] = -1
+        self.count += 1
+        if t:
+            stream = i % self.num_streams
+            # slots of this episode that have not been overwritten yet
+            oldest = max(self.count - len(self), self.episode_start[stream])
+            first = i - (i - oldest) // self.num_streams * self.num_streams
+            self.episode_end[np.arange(first, i + 1, self.num_streams) % self.maxlen] = i
+            self.episode_start[stream] = i + self.num_streams
+
+    def sample(self, batch_size):
+        indices = np.random.randint(0, len(self), size=batch_size)
+        S1, A, R, S2, T = self.S1[indices], self.A[indices], self.R[indices], \
+            self.S2[indices], self.T[indices]
+        relabel = np.random.uniform(size=batch_size) < self.relabel_prob
+        if not np.any(relabel):
+            return S1, A, R, S2, T
+        indices = indices[relabel]
+        start, end = self.index[indices], self.episode_end[indices]
+        latest = self.count - 1
+        running = end < 0
+        end[running] = latest - (latest - start[running]) % self.num_streams
+        num_future = (end - start) // self.num_streams + 1
+        offsets = np.floor(np.random.uniform(size=len(indices)) * num_future)
+        future = (start + offsets.astype(np.int64) * self.num_streams) % self.maxlen
+        goals = self.S2[future][:, self.achieved_goal]
+
+        achieved = S2[relabel][:, self.achieved_goal]
+        _, reached = self.goal_reward(achieved, S2[relabel][:, self.goal])
+        # terminals that did not come from reaching the original goal are time limits
+        timeout = (T[relabel] > 0) & ~reached
+        rewards, reached = self.goal_reward(achieved, goals)
+
+        rows = np.flatnonzero(relabel)
+        S1[rows, self.goal] = goals
+        S2[rows, self.goal] = goals
+        R[rows] = rewards / self.reward_scale
+        T[rows] = timeout | reached
+        return S1, A, R, S2, T
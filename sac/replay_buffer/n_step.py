@@ -0,0 +1,55 @@
+from collections import deque
+
+import numpy as np
+
+from sac.replay_buffer.replay_buffer import ArrayReplayBuffer
+
+
+class NStepReplayBuffer(ArrayReplayBuffer):
+    """
+    ArrayReplayBuffer that stores n-step transitions. Appended one-step
+    transitions wait in a rolling window; every new reward is added, discounted
+    by its distance, to the partial returns of the transitions in the window,
+    and once a transition has seen `n_step` rewards it is stored as
+    (s1, a, sum_k gamma^k r_k, s_{t+n}, t, gamma^n). A terminal flushes the
+    whole window with truncated returns, the terminal s2 and t=1.
+
+    `sample` returns the stored discounts D after S1, A, R, S2, T, to be fed
+    as the `D` of the agent's train step. As with HindsightReplayBuffer,
+    `num_streams` envs may append in lockstep, each with its own window.
+    """
+
+    def __init__(self, maxlen, s_shape, a_shape, n_step, gamma, num_streams=1):
+        super(NStepReplayBuffer, self).__init__(maxlen, s_shape, a_shape)
+        self.D = self.allocate('D', [maxlen], np.float32)
+        self.n_step = n_step
+        self.gamma = gamma
+        self.num_streams = num_streams
+        self.discounts = gamma ** np.arange(n_step + 1)
+        self.windows = [deque() for _ in range(num_streams)]
+        self.count = 0
+
+    def append(self, s1, a, r, s2, t):
+        window = self.windows[self.count % self.num_streams]
+        self.count += 1
+        # entries are [s1, a, partial return]; the newest one has age 0
+        window.append([np.array(s1), np.array(a), 0.])
+        for age, entry in enumerate(reversed(window)):
+            entry[2] += self.discounts[age] * r
+        if t:
+            while window:
+                self.store(window, s2, t)
+        elif len(window) == self.n_step:
+            self.store(window, s2, t)
+
+    def store(self, window, s2, t):
+        # the oldest entry bootstraps from s2 after len(window) rewards
+        steps = len(window)
+        s1, a, R = window.popleft()
+        self.D[self.pos] = self.discounts[steps]
+        super(NStepReplayBuffer, self).append(s1, a, R, s2, t)
+
+    def sample(self, batch_size):
+        indices = np.random.randint(0, len(self), size=batch_size)
+        return self.S1[indices], self.A[indices], self.R[indices], \
+            self.S2[indices], self.T[indices], self.D[indices]
@@ -0,0 +1,66 @@
+import threading
+from queue import Queue, Empty, Full
+
+
+class PrefetchingBuffer(object):
+    """
+    Wraps a replay buffer with a producer thread that keeps up to `depth`
+    batches of `batch_size` transitions sampled ahead in a bounded queue, so
+    that `sample` normally returns a ready batch while the session is busy.
+    Every `sample` call that finds the queue empty and has to wait for the
+    producer is counted in `starved`.
+    """
+
+    def __init__(self, buffer, batch_size, depth=2):
+        self.buffer = buffer
+        self.batch_size = batch_size
+        self.depth = depth
+        self.queue = Queue(maxsize=depth)
+        # appends and samples of the wrapped buffer must not interleave
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.batches = 0
+        self.starved = 0
+
+    def append(self, s1, a, r, s2, t):
+        with self.lock:
+            self.buffer.append(s1, a, r, s2, t)
+
+    def produce(self):
+        while not self.stop_event.is_set():
+            with self.lock:
+                batch = self.buffer.sample(self.batch_size)
+            while not self.stop_event.is_set():
+                try:
+                    self.queue.put(batch, timeout=0.1)
+                    break
+                except Full:
+                    continue
+
+    def sample(self, batch_size):
+        if batch_size != self.batch_size:
+            raise ValueError('PrefetchingBuffer samples batches of %s, not %s' %
+                             (self.batch_size, batch_size))
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.produce, daemon=True)
+            self.thread.start()
+        try:
+            batch = self.queue.get_nowait()
+        except Empty:
+            self.starved += 1
+            batch = self.queue.get()
+        self.batches += 1
+        return batch
+
+    def update_priorities(self, indices, td_errors):
+        with self.lock:
+            self.buffer.update_priorities(indices, td_errors)
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __len__(self):
+        return len(self.buffer)
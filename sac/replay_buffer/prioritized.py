@@ -0,0 +1,88 @@
+import numpy as np
+
+from sac.replay_buffer.replay_buffer import ArrayReplayBuffer
+
+
+class SumTree(object):
+    """
+    Binary tree over `capacity` non-negative leaves in which every internal
+    node holds the sum of its children. Node 1 is the root and leaf i is node
+    `capacity + i` (capacity is rounded up to a power of two). Updates and
+    prefix-sum lookups touch one node per level and are vectorized over
+    batches of leaves.
+    """
+
+    def __init__(self, capacity):
+        self.depth = int(np.ceil(np.log2(max(capacity, 2))))
+        self.capacity = 2 ** self.depth
+        self.tree = np.zeros(2 * self.capacity, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, indices):
+        return self.tree[np.asarray(indices) + self.capacity]
+
+    def update(self, indices, values):
+        nodes = np.asarray(indices) + self.capacity
+        self.tree[nodes] = values
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        Returns, for each value in [0, total), the leaf whose prefix-sum
+        interval contains it.
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            # never descend into an empty subtree because of rounding
+            go_right = (values >= left_sum) & (self.tree[left + 1] > 0)
+            values = np.where(go_right, values - left_sum, values)
+            nodes = np.where(go_right, left + 1, left)
+        return nodes - self.capacity
+
+
+class PrioritizedReplayBuffer(ArrayReplayBuffer):
+    """
+    ArrayReplayBuffer that samples transition i with probability proportional
+    to p_i ** alpha, where p_i is its last absolute TD error (plus `eps`).
+    New transitions get the largest priority seen so far. `sample` also
+    returns importance weights (len * P(i)) ** -beta, normalized by their
+    maximum, and the sampled indices to pass back to `update_priorities`.
+    """
+
+    def __init__(self, maxlen, s_shape, a_shape, s_dtype=np.float32,
+                 alpha=0.6, beta=0.4, eps=1e-6):
+        super(PrioritizedReplayBuffer, self).__init__(maxlen, s_shape, a_shape, s_dtype)
+        self.alpha = alpha
+        self.beta = beta
+        self.eps = eps
+        self.tree = SumTree(maxlen)
+        self.max_priority = 1.
+
+    def append(self, s1, a, r, s2, t):
+        pos = self.pos
+        super(PrioritizedReplayBuffer, self).append(s1, a, r, s2, t)
+        self.tree.update([pos], [self.max_priority ** self.alpha])
+
+    def sample(self, batch_size):
+        # stratified: one draw from each of batch_size equal slices of the total
+        total = self.tree.total()
+        segment = total / batch_size
+        values = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * segment
+        indices = self.tree.find(np.minimum(values, total))
+        probs = self.tree.get(indices) / total
+        weights = (len(self) * probs) ** -self.beta
+        weights = (weights / weights.max()).astype(np.float32)
+        return self.S1[indices], self.A[indices], self.R[indices], \
+            self.S2[indices], self.T[indices], weights, indices
+
+    def update_priorities(self, indices, td_errors):
+        priorities = np.abs(td_errors) + self.eps
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(indices, priorities ** self.alpha)
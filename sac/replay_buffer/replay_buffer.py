@@ -1,3 +1,7 @@
+import json
+import os
+import threading
+
 import numpy as np
 from collections import deque
 
@@ -85,3 +89,233 @@ class ReplayBuffer2(object):
         return len(self.buffer)
 
 
+class ArrayReplayBuffer(object):
+    """
+    Rolling replay buffer backed by preallocated arrays. Storage for each of
+    s1/a/r/s2/t is allocated once, and batches are gathered with fancy
+    indexing so `sample` returns arrays that can be fed directly.
+    """
+
+    def __init__(self, maxlen, s_shape, a_shape, s_dtype=np.float32):
+        self.maxlen = maxlen
+        s_shape, a_shape = list(s_shape), list(a_shape)
+        self.S1 = self.allocate('S1', [maxlen] + s_shape, s_dtype)
+        self.A = self.allocate('A', [maxlen] + a_shape, np.float32)
+        self.R = self.allocate('R', [maxlen], np.float32)
+        self.S2 = self.allocate('S2', [maxlen] + s_shape, s_dtype)
+        self.T = self.allocate('T', [maxlen], np.float32)
+        self.pos = 0
+        self.full = False
+
+    def allocate(self, name, shape, dtype):
+        return np.empty(shape, dtype=dtype)
+
+    def append(self, s1, a, r, s2, t):
+        self.S1[self.pos] = s1
+        self.A[self.pos] = a
+        self.R[self.pos] = r
+        self.S2[self.pos] = s2
+        self.T[self.pos] = t
+        self.pos += 1
+        if self.pos >= self.maxlen:
+            self.full = True
+            self.pos = 0
+
+    def sample(self, batch_size):
+        indices = np.random.randint(0, len(self), size=batch_size)
+        return self.S1[indices], self.A[indices], self.R[indices], \
+            self.S2[indices], self.T[indices]
+
+    def __len__(self):
+        return self.maxlen if self.full else self.pos
+
+
+class MemmapReplayBuffer(ArrayReplayBuffer):
+    """
+    ArrayReplayBuffer whose arrays live in memory-mapped .npy files under
+    `directory`, so only the pages that are touched are held in RAM. If the
+    directory already holds a buffer it is reopened and filling continues from
+    the cursor saved by the last call to `flush`.
+    """
+
+    def __init__(self, directory, maxlen, s_shape, a_shape, s_dtype=np.float32):
+        self.directory = directory
+        self.meta_path = os.path.join(directory, 'meta.json')
+        os.makedirs(directory, exist_ok=True)
+        self.resumed = os.path.exists(self.meta_path)
+        super(MemmapReplayBuffer, self).__init__(maxlen, s_shape, a_shape, s_dtype)
+        if self.resumed:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            self.pos = meta['pos']
+            self.full = meta['full']
+
+    def allocate(self, name, shape, dtype):
+        path = os.path.join(self.directory, name + '.npy')
+        if self.resumed:
+            array = np.load(path, mmap_mode='r+')
+            if array.shape != tuple(shape) or array.dtype != np.dtype(dtype):
+                raise ValueError('%s holds %s %s, expected %s %s' % (
+                    path, array.shape, array.dtype, tuple(shape), np.dtype(dtype)))
+            return array
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(shape))
+
+    def flush(self):
+        for array in (self.S1, self.A, self.R, self.S2, self.T):
+            array.flush()
+        # write the cursor only after the data it covers is on disk
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'pos': self.pos, 'full': self.full}, f)
+        os.replace(tmp_path, self.meta_path)
+
+
+class FrameReplayBuffer(object):
+    """
+    Replay buffer for pixel observations that stores every frame once, as
+    uint8, in a ring. Transitions hold the absolute indices of their s1 and s2
+    frames. Since the s2 of one step is the s1 of the next, a separate s1 frame
+    is only written for the first transition after a terminal one.
+
+    With `frame_stack` > 1, `sample` concatenates each frame with its
+    predecessors from the same episode along the channel axis, repeating the
+    first frame of the episode where there are too few. Stacks are gathered
+    from the stored frames at sample time and never stored themselves.
+    Stacking is library-only: run_training uses `frame_stack=1`, since the
+    agent's s_shape and the observations it acts on would need stacking too.
+    """
+
+    def __init__(self, maxlen, frame_shape, a_shape, frame_stack=1,
+                 frame_capacity=None):
+        if frame_capacity is None:
+            # one frame per transition plus the extra s1 frame of each episode
+            frame_capacity = maxlen + maxlen // 4 + frame_stack
+        self.maxlen = maxlen
+        self.frame_stack = frame_stack
+        self.frame_capacity = frame_capacity
+        self.frames = np.empty([frame_capacity] + list(frame_shape), dtype=np.uint8)
+        # absolute index of the first frame of the episode that each frame is in
+        self.episode_start = np.empty([frame_capacity], dtype=np.int64)
+        self.S1 = np.empty([maxlen], dtype=np.int64)
+        self.S2 = np.empty([maxlen], dtype=np.int64)
+        self.A = np.empty([maxlen] + list(a_shape), dtype=np.float32)
+        self.R = np.empty([maxlen], dtype=np.float32)
+        self.T = np.empty([maxlen], dtype=np.float32)
+        self.num_frames = 0
+        self.num_transitions = 0
+        self.oldest = 0
+        self.new_episode = True
+        self.current_episode_start = 0
+        self.last_frame = 0
+
+    def add_frame(self, frame):
+        idx = self.num_frames
+        self.frames[idx % self.frame_capacity] = frame
+        self.episode_start[idx % self.frame_capacity] = self.current_episode_start
+        self.num_frames += 1
+        return idx
+
+    def append(self, s1, a, r, s2, t):
+        if self.new_episode:
+            self.current_episode_start = self.num_frames
+            s1_idx = self.add_frame(s1)
+        else:
+            s1_idx = self.last_frame
+        self.last_frame = self.add_frame(s2)
+        self.new_episode = bool(t)
+
+        pos = self.num_transitions % self.maxlen
+        self.S1[pos] = s1_idx
+        self.A[pos] = a
+        self.R[pos] = r
+        self.S2[pos] = self.last_frame
+        self.T[pos] = t
+        self.num_transitions += 1
+
+        # drop the oldest transitions once their frames (or any frame that
+        # could be stacked with them) have been overwritten
+        self.oldest = max(self.oldest, self.num_transitions - self.maxlen)
+        min_frame = self.num_frames - self.frame_capacity + self.frame_stack - 1
+        while self.oldest < self.num_transitions and \
+                self.S1[self.oldest % self.maxlen] < min_frame:
+            self.oldest += 1
+
+    def get_frames(self, frame_ids):
+        if self.frame_stack == 1:
+            return self.frames[frame_ids % self.frame_capacity]
+        offsets = np.arange(self.frame_stack - 1, -1, -1)
+        starts = self.episode_start[frame_ids % self.frame_capacity]
+        stack_ids = np.maximum(frame_ids[:, None] - offsets, starts[:, None])
+        stacked = self.frames[stack_ids % self.frame_capacity]
+        # [batch, stack, height, width, channels] -> [batch, height, width, stack * channels]
+        stacked = np.moveaxis(stacked, 1, -2)
+        return stacked.reshape(stacked.shape[:-2] + (-1,))
+
+    def sample(self, batch_size):
+        indices = (self.oldest + np.random.randint(0, len(self), size=batch_size)) \
+                % self.maxlen
+        return self.get_frames(self.S1[indices]), self.A[indices], self.R[indices], \
+            self.get_frames(self.S2[indices]), self.T[indices]
+
+    def __len__(self):
+        return self.num_transitions - self.oldest
+
+
+class LockedBuffer(object):
+    """
+    Serializes access to a replay buffer that is shared between threads.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.lock = threading.Lock()
+
+    def append(self, s1, a, r, s2, t):
+        with self.lock:
+            self.buffer.append(s1, a, r, s2, t)
+
+    def sample(self, batch_size):
+        with self.lock:
+            return self.buffer.sample(batch_size)
+
+    def update_priorities(self, indices, td_errors):
+        with self.lock:
+            self.buffer.update_priorities(indices, td_errors)
+
+    def __len__(self):
+        return len(self.buffer)
+
+
+class StatisticsBuffer(object):
+    """
+    Passes transitions through to a replay buffer and hands every
+    `interval` of them to `update` as a batch of observations (s2) and
+    rewards, e.g. to fold them into an agent's normalization moments.
+    """
+
+    def __init__(self, buffer, update, interval=1000):
+        self.buffer = buffer
+        self.update = update
+        self.interval = interval
+        self.S, self.R = [], []
+
+    def append(self, s1, a, r, s2, t):
+        self.buffer.append(s1, a, r, s2, t)
+        self.S.append(s2)
+        self.R.append(r)
+        if len(self.R) >= self.interval:
+            self.flush_statistics()
+
+    def flush_statistics(self):
+        if self.R:
+            self.update(np.array(self.S), np.array(self.R))
+        self.S, self.R = [], []
+
+    def sample(self, batch_size):
+        return self.buffer.sample(batch_size)
+
+    def update_priorities(self, indices, td_errors):
+        self.buffer.update_priorities(indices, td_errors)
+
+    def __len__(self):
+        return len(self.buffer)
@@ -0,0 +1,113 @@
+import multiprocessing
+
+import numpy as np
+
+from sac.shared_memory import SharedArrays
+
+
+class SharedReplayBuffer(object):
+    """
+    Rolling replay buffer whose arrays live in shared memory, so actor
+    processes append to it directly and the learner samples from the same
+    memory without transitions ever being pickled between processes.
+
+    Slots are claimed with an atomic fetch-and-increment of a shared write
+    cursor, so any number of processes can append concurrently. Copying a
+    transition in takes one of `num_locks` striped locks, which only makes
+    writers wait when the ring wraps around onto a slot another writer is
+    still filling, e.g. one that was descheduled. Each slot also
+    records the absolute index of the transition it holds (+1), set to -1
+    while it is being written. `sample` reads these before and after
+    copying a batch out of the shared arrays and redraws the rows whose
+    slot was unwritten, mid-write or overwritten in between, so every row
+    is one complete transition. The batch is a private copy the writers
+    cannot change.
+    """
+
+    def __init__(self, maxlen, s_shape, a_shape, s_dtype=np.float32, num_locks=64):
+        self.maxlen = maxlen
+        s_shape, a_shape = list(s_shape), list(a_shape)
+        self.arrays = SharedArrays()
+        self.S1 = self.arrays.create('S1', [maxlen] + s_shape, s_dtype)
+        self.A = self.arrays.create('A', [maxlen] + a_shape, np.float32)
+        self.R = self.arrays.create('R', [maxlen], np.float32)
+        self.S2 = self.arrays.create('S2', [maxlen] + s_shape, s_dtype)
+        self.T = self.arrays.create('T', [maxlen], np.float32)
+        self.written = self.arrays.create('written', [maxlen], np.int64)
+        self.written[:] = 0
+        # spawn context locks can be shared with forked and spawned processes
+        context = multiprocessing.get_context('spawn')
+        self.cursor = context.Value('q', 0)
+        self.locks = [context.Lock() for _ in range(min(num_locks, maxlen))]
+
+    def __getstate__(self):
+        return {'maxlen': self.maxlen, 'arrays': self.arrays, 'cursor': self.cursor,
+                'locks': self.locks}
+
+    def __setstate__(self, state):
+        self.maxlen = state['maxlen']
+        self.arrays = state['arrays']
+        self.cursor = state['cursor']
+        self.locks = state['locks']
+        for name in ['S1', 'A', 'R', 'S2', 'T', 'written']:
+            setattr(self, name, self.arrays[name])
+
+    def append(self, s1, a, r, s2, t):
+        with self.cursor.get_lock():
+            i = self.cursor.value
+            self.cursor.value = i + 1
+        pos = i % self.maxlen
+        with self.locks[pos % len(self.locks)]:
+            # a writer that lapped this one may have filled the slot already
+            if self.written[pos] > i:
+                return
+            self.written[pos] = -1
+            self.S1[pos] = s1
+            self.A[pos] = a
+            self.R[pos] = r
+            self.S2[pos] = s2
+            self.T[pos] = t
+            self.written[pos] = i + 1
+
+    def sample(self, batch_size):
+        size = len(self)
+        indices = np.random.randint(0, size, size=batch_size)
+        batch = [None] * 5
+        rows = np.arange(batch_size)
+        while len(rows):
+            # like a seqlock: a row is only kept if its slot held the same
+            # complete transition before and after it was copied
+            before = self.written[indices[rows]]
+            for k, array in enumerate([self.S1, self.A, self.R, self.S2, self.T]):
+                values = array[indices[rows]]
+                if batch[k] is None:
+                    batch[k] = values
+                else:
+                    batch[k][rows] = values
+            after = self.written[indices[rows]]
+            rows = rows[(before <= 0) | (before != after)]
+            ready = np.flatnonzero(self.written[:size] > 0)
+            if len(ready):
+                indices[rows] = ready[np.random.randint(0, len(ready), size=len(rows))]
+            else:
+                # every slot is being written, so wait for one to finish
+                indices[rows] = np.random.randint(0, size, size=len(rows))
+        return tuple(batch)
+
+    # the cursor in the terms of ArrayReplayBuffer, e.g. for export_buffer
+    @property
+    def pos(self):
+        return self.cursor.value % self.maxlen
+
+    @property
+    def full(self):
+        return self.cursor.value >= self.maxlen
+
+    def __len__(self):
+        return min(self.cursor.value, self.maxlen)
+
+    def close(self):
+        # the views have to go before their memory can be unmapped
+        for name in ['S1', 'A', 'R', 'S2', 'T', 'written']:
+            setattr(self, name, None)
+        self.arrays.close()
@@ -0,0 +1,112 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArrays(object):
+    """
+    Named NumPy arrays backed by shared memory blocks. Processes forked after
+    the arrays are created use them directly; pickling (e.g. passing them to
+    a spawned Process) only sends the block names, and the unpickled copy
+    maps the same memory, so arrays are never serialized. The creating copy
+    owns the blocks and unlinks them on `close`.
+    """
+
+    def __init__(self):
+        self.specs = {}
+        self.blocks = {}
+        self.arrays = {}
+        self.owner = True
+
+    def create(self, name, shape, dtype):
+        shape, dtype = tuple(shape), np.dtype(dtype)
+        size = max(1, int(np.prod(shape)) * dtype.itemsize)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        self.specs[name] = (block.name, shape, dtype.str)
+        self.blocks[name] = block
+        self.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        return self.arrays[name]
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __getstate__(self):
+        return {'specs': self.specs}
+
+    def __setstate__(self, state):
+        self.specs = state['specs']
+        self.owner = False
+        self.blocks, self.arrays = {}, {}
+        for name, (block_name, shape, dtype) in self.specs.items():
+            # attaching registers the block with the resource tracker again,
+            # which child processes share with the owner, so it is still
+            # only unlinked once
+            block = shared_memory.SharedMemory(name=block_name)
+            self.blocks[name] = block
+            self.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    def close(self):
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = {}
+
+
+class SharedPolicyParams(object):
+    """
+    Policy parameters in shared memory, published by the learner and read
+    by actor processes. `publish` and `read` copy under a shared lock, so
+    readers never see a mix of two snapshots, and `version` tells actors
+    whether there is anything new to read. Actors `request` a publish, and
+    the learner shares its update count so actors can tell how stale their
+    copy is.
+    """
+
+    def __init__(self, params):
+        self.arrays = SharedArrays()
+        for name, value in params.items():
+            self.arrays.create(name, np.shape(value), np.asarray(value).dtype)
+        self.names = sorted(params)
+        context = multiprocessing.get_context('spawn')
+        self.counter = context.Value('q', 0)
+        self.updates = context.Value('q', 0, lock=False)
+        self.published_at = context.Value('q', 0, lock=False)
+        self.publish_requested = context.Event()
+        self.publish(params)
+
+    def publish(self, params, updates=0):
+        with self.counter.get_lock():
+            for name in self.names:
+                self.arrays[name][...] = params[name]
+            self.published_at.value = updates
+            self.counter.value += 1
+        self.publish_requested.clear()
+
+    def read(self):
+        with self.counter.get_lock():
+            return {name: self.arrays[name].copy() for name in self.names}, \
+                self.counter.value
+
+    def version(self):
+        return self.counter.value
+
+    def request(self):
+        self.publish_requested.set()
+
+    def requested(self):
+        return self.publish_requested.is_set()
+
+    def set_learner_updates(self, updates):
+        self.updates.value = updates
+
+    def learner_updates(self):
+        return self.updates.value
+
+    def published_updates(self):
+        return self.published_at.value
+
+    def close(self):
+        self.arrays.close()
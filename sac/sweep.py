@@ -0,0 +1,181 @@
+import argparse
+import itertools
+import json
+import os
+import queue
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def build_runs(grid, seeds, base_args):
+    """
+    Returns one run per combination of the values in `grid` (a dict from
+    CLI flag of `sac.main` to a list of values) and seed, each as a dict
+    with its settings and the full argument list.
+    """
+    flags = sorted(grid)
+    runs = []
+    for values in itertools.product(*[grid[flag] for flag in flags]):
+        settings = dict(zip(flags, values))
+        for seed in seeds:
+            args = list(base_args)
+            for flag, value in sorted(settings.items()):
+                if value is True:
+                    args.append(flag)
+                elif value is not False and value is not None:
+                    args += [flag, str(value)]
+            runs.append({'id': len(runs), 'settings': settings, 'seed': seed,
+                         'args': args + ['--seed', str(seed)]})
+    return runs
+
+
+def cpu_slots(num_workers, cpus_per_run):
+    """
+    Splits the CPUs this process may use into `num_workers` disjoint sets of
+    `cpus_per_run` CPUs.
+    """
+    cpus = sorted(os.sched_getaffinity(0))
+    if num_workers * cpus_per_run > len(cpus):
+        raise ValueError('%s workers with %s CPUs each need %s CPUs, only %s are '
+                         'available' % (num_workers, cpus_per_run,
+                                        num_workers * cpus_per_run, len(cpus)))
+    return [cpus[i * cpus_per_run:(i + 1) * cpus_per_run] for i in range(num_workers)]
+
+
+def read_metrics(path, last_episodes=10):
+    summary = {'episodes': 0, 'time_steps': 0, 'final_reward': None,
+               'final_eval_return': None}
+    if not os.path.exists(path):
+        return summary
+    rewards = []
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['type'] == 'episode':
+                rewards.append(record['reward'])
+                summary['time_steps'] = record['time_steps']
+            elif record['type'] == 'evaluation':
+                summary['final_eval_return'] = record['mean_return']
+    summary['episodes'] = len(rewards)
+    if rewards:
+        summary['final_reward'] = float(np.mean(rewards[-last_episodes:]))
+    return summary
+
+
+def launch(run, slots, output_dir, inter_op_threads, timeout):
+    """
+    Runs `sac.main` for `run` on a free CPU slot, with TensorFlow's intra-op
+    pool sized to the slot, and returns the run's summary.
+    """
+    run_dir = os.path.join(output_dir, 'run_%03d' % run['id'])
+    os.makedirs(run_dir, exist_ok=True)
+    metrics_path = os.path.join(run_dir, 'metrics.jsonl')
+    # Metrics appends, so lines of an earlier sweep into this directory
+    # would be read as this run's
+    if os.path.exists(metrics_path):
+        os.remove(metrics_path)
+    cpus = slots.get()
+    try:
+        args = [sys.executable, '-m', 'sac.main'] + run['args'] + [
+            '--metrics-path', metrics_path,
+            '--cpus', ','.join(map(str, cpus)),
+            '--intra-op-threads', str(len(cpus)),
+            '--inter-op-threads', str(inter_op_threads)]
+        with open(os.path.join(run_dir, 'run.json'), 'w') as f:
+            json.dump(dict(run, cpus=cpus, command=args), f, indent=2)
+        # keep OpenMP/BLAS pools inside the budget as well
+        env = dict(os.environ, OMP_NUM_THREADS=str(len(cpus)),
+                   MKL_NUM_THREADS=str(len(cpus)))
+        start = time.time()
+        with open(os.path.join(run_dir, 'stdout.log'), 'w') as log:
+            process = subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT, env=env)
+            try:
+                returncode = process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.terminate()
+                returncode = process.wait()
+        seconds = time.time() - start
+    finally:
+        slots.put(cpus)
+    summary = dict(id=run['id'], settings=run['settings'], seed=run['seed'],
+                   returncode=returncode, seconds=seconds, run_dir=run_dir)
+    summary.update(read_metrics(metrics_path))
+    print('run %s %s seed %s: exit %s after %.0fs, final reward %s' % (
+        run['id'], run['settings'], run['seed'], returncode, seconds,
+        summary['final_reward']))
+    return summary
+
+
+def aggregate(summaries):
+    """ Mean and std over seeds of the final rewards of each setting. """
+    groups = {}
+    for summary in summaries:
+        key = json.dumps(summary['settings'], sort_keys=True)
+        groups.setdefault(key, []).append(summary)
+    results = []
+    for key, group in sorted(groups.items()):
+        rewards = [s['final_reward'] for s in group if s['final_reward'] is not None]
+        results.append({'settings': json.loads(key),
+                        'seeds': [s['seed'] for s in group],
+                        'mean_final_reward': float(np.mean(rewards)) if rewards else None,
+                        'std_final_reward': float(np.std(rewards)) if rewards else None})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Runs sac.main for every combination of a grid of its '
+                    'arguments and seeds on a pool of pinned CPU slots. '
+                    'Arguments after -- are passed to every run.')
+    parser.add_argument('--grid', default='{}',
+                        help='JSON object (or path to a JSON file) mapping '
+                             'sac.main flags to lists of values, '
+                             'e.g. \'{"--batch-size": [32, 256]}\'')
+    parser.add_argument('--seeds', default='0',
+                        help='comma-separated seeds, run for every setting')
+    parser.add_argument('--num-workers', default=None, type=int,
+                        help='runs at once (default: available CPUs / --cpus-per-run)')
+    parser.add_argument('--cpus-per-run', default=1, type=int,
+                        help='CPUs each run is pinned to; also its intra-op thread count')
+    parser.add_argument('--inter-op-threads', default=1, type=int)
+    parser.add_argument('--timeout', default=None, type=float,
+                        help='seconds after which a run is terminated')
+    parser.add_argument('--output-dir', default='sweep')
+    parser.add_argument('base_args', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    if os.path.exists(args.grid):
+        with open(args.grid) as f:
+            grid = json.load(f)
+    else:
+        grid = json.loads(args.grid)
+    base_args = args.base_args[1:] if args.base_args[:1] == ['--'] else args.base_args
+    if '--max-time-steps' not in base_args and '--max-time-steps' not in grid \
+            and args.timeout is None:
+        parser.error('runs never finish without --max-time-steps or --timeout')
+    runs = build_runs(grid, [int(seed) for seed in args.seeds.split(',')], base_args)
+    num_workers = args.num_workers or max(
+        1, len(os.sched_getaffinity(0)) // args.cpus_per_run)
+    num_workers = min(num_workers, len(runs))
+    slots = queue.Queue()
+    for cpus in cpu_slots(num_workers, args.cpus_per_run):
+        slots.put(cpus)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    print('%s runs on %s workers with %s CPUs each' % (
+        len(runs), num_workers, args.cpus_per_run))
+    with ThreadPoolExecutor(num_workers) as pool:
+        summaries = list(pool.map(
+            lambda run: launch(run, slots, args.output_dir, args.inter_op_threads,
+                               args.timeout), runs))
+    summary = {'grid': grid, 'base_args': base_args, 'runs': summaries,
+               'settings': aggregate(summaries)}
+    with open(os.path.join(args.output_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    for result in summary['settings']:
+        print('%-60s %s +/- %s' % (result['settings'], result['mean_final_reward'],
+                                   result['std_final_reward']))
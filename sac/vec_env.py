@@ -0,0 +1,109 @@
+from multiprocessing import Pipe, Process
+
+import numpy as np
+
+
+def worker(remote, parent_remote, env_fn):
+    parent_remote.close()
+    env = env_fn()
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                remote.send(env.step(data))
+            elif cmd == 'reset':
+                remote.send(env.reset())
+            elif cmd == 'spaces':
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == 'close':
+                break
+            else:
+                raise ValueError('Unknown command %s' % cmd)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        env.close()
+        remote.close()
+
+
+class SerialVecEnv(object):
+    """
+    Steps envs one after another in this process, behind the same interface
+    as SubprocVecEnv.
+    """
+
+    def __init__(self, env_fns):
+        self.num_envs = len(env_fns)
+        self.envs = [env_fn() for env_fn in env_fns]
+        self.observation_space = self.envs[0].observation_space
+        self.action_space = self.envs[0].action_space
+        self.obs = None
+
+    def step(self, actions):
+        s2, r, t, infos = zip(*[env.step(a) for (env, a) in zip(self.envs, actions)])
+        self.obs = np.stack(s2)
+        return self.obs.copy(), np.array(r), np.array(t), infos
+
+    def reset(self, indices=None):
+        if indices is None:
+            self.obs = np.stack([env.reset() for env in self.envs])
+        else:
+            for i in indices:
+                self.obs[i] = self.envs[i].reset()
+        return self.obs.copy()
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+
+class SubprocVecEnv(object):
+    """
+    Runs one env per worker process and steps them all in parallel. Like
+    VectorChaserEnv, envs are not reset automatically: `step` returns the
+    post-step observation of every env and `reset(indices)` restarts the
+    given envs, returning the observations of the whole batch.
+    """
+
+    def __init__(self, env_fns):
+        self.num_envs = len(env_fns)
+        self.remotes, work_remotes = zip(*[Pipe() for _ in env_fns])
+        self.processes = [Process(target=worker, args=(work_remote, remote, env_fn), daemon=True)
+                          for (work_remote, remote, env_fn) in zip(work_remotes, self.remotes, env_fns)]
+        for process in self.processes:
+            process.start()
+        for work_remote in work_remotes:
+            work_remote.close()
+        self.remotes[0].send(('spaces', None))
+        self.observation_space, self.action_space = self.remotes[0].recv()
+        self.obs = None
+        self.closed = False
+
+    def step(self, actions):
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', action))
+        s2, r, t, infos = zip(*[remote.recv() for remote in self.remotes])
+        self.obs = np.stack(s2)
+        return self.obs.copy(), np.array(r), np.array(t), infos
+
+    def reset(self, indices=None):
+        if indices is None:
+            indices = range(self.num_envs)
+        for i in indices:
+            self.remotes[i].send(('reset', None))
+        obs = [(i, self.remotes[i].recv()) for i in indices]
+        if self.obs is None:
+            self.obs = np.stack([o for (_, o) in obs])
+        else:
+            for i, o in obs:
+                self.obs[i] = o
+        return self.obs.copy()
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.closed = True